@@ -26,88 +26,159 @@ Written by Horst Gutmann (https://github.com/zerok)
 
 from __future__ import print_function
 
+from multiprocessing.pool import ThreadPool
+
 import argparse
+import collections
+import csv
+import gzip
+import itertools
 import logging
+import multiprocessing
 import os
+import sys
+import zipfile
 
 import matplotlib.pyplot as plt
 import numpy as np
-import requests
-import tablib
+
+try:
+    # Only needed for writing Parquet files.
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from httpcache import DEFAULT_MAX_SIZE, ResponseCache
+from session import create_session, default_session, set_default_session
+from store import PlatformStore
 
 
 CPI_DATA_URL = 'http://research.stlouisfed.org/fred2/data/CPIAUCSL.txt'
 
+# Largest number of platforms the API returns per page.
+PAGE_SIZE = 100
+
+# Number of platforms whose prices are adjusted, and which are written
+# into a Parquet file, at once.
+BATCH_SIZE = 1000
+
+# Columns of the CSV and Parquet output, and the fields they come from.
+OUTPUT_COLUMNS = (('Abbreviation', 'abbreviation'), ('Name', 'name'),
+                  ('Year', 'year'), ('Price', 'original_price'),
+                  ('Adjusted price', 'adjusted_price'))
+
+try:
+    basestring
+except NameError:
+    # Python 3 only has str.
+    basestring = str
+
+# Fields a platform needs to have for us to be able to use it.
+REQUIRED_FIELDS = ('release_date', 'original_price', 'name', 'abbreviation')
+
+# Size of the chunks the CPI data is downloaded in.
+CPI_CHUNK_SIZE = 4 * 1024
+
+# Appended to the name of the CPI file to get the name of its binary cache.
+CPI_CACHE_SUFFIX = '.npz'
+
 
 class CPIData(object):
     """Abstraction of the CPI data provided by FRED.
 
-    This stores internally only one value per year.
+    This stores the CPI of every month in a NumPy array, along with the
+    average of every year.
 
     """
 
     def __init__(self):
-        # Each year available to the dataset will end up as a simple key-value
-        # pair within this dict. We don't really need any order here so going
-        # with a plain old dictionary is the best approach.
-        self.year_cpi = {}
+        # The CPI of each month ends up in "month_cpi", one value per month
+        # starting with January of "first_year". Months missing from the
+        # dataset are NaN ("not a number"). Looking up a month is then
+        # nothing but computing its position in the array:
+        #
+        #     (year - first_year) * 12 + (month - 1)
+        #
+        # "year_cpi_array" holds the average CPI of each year the same way,
+        # with one value per year starting with "first_year".
+        self.month_cpi = np.empty(0)
+        self.year_cpi_array = np.empty(0)
 
         # Later on we will also remember the first and the last year we
         # have found in the dataset to handle years prior or after the
         # documented time span.
         self.last_year = None
         self.first_year = None
+        self.last_month = None
 
-    def load_from_url(self, url, save_as_file=None):
+    @property
+    def year_cpi(self):
+        """The average CPI of each year we have data for, as a dictionary
+        keyed by the year."""
+        return dict((self.first_year + index, cpi)
+                    for index, cpi in enumerate(self.year_cpi_array.tolist())
+                    if not np.isnan(cpi))
+
+    def load_from_url(self, url, save_as_file=None, session=None):
         """Loads data from a given url.
 
         The downloaded file can also be saved into a location for later re-use
         with the "save_as_file" parameter specifying a filename.
 
-        After fetching the file this implementation uses load_from_file
-        internally.
+        The request goes through the given requests.Session, or the one
+        shared by all API clients (see session.py).
+
+        The file is parsed while it is being downloaded, by handing its
+        lines to load_from_file as they come in.
 
         """
+        if session is None:
+            session = default_session()
+
         # We don't really know how much data we are going to get here, so
         # it is recommended to just keep as little data as possible in memory
-        # at all times. Since python-requests supports gzip-compression by
-        # default and decoding these chunks on their own isn't that easy,
-        # we just disable gzip with the empty "Accept-Encoding" header.
-        response = requests.get(url, stream=True,
-                                headers={'Accept-Encoding': None})
-
-        # If we did not pass in a save_as_file parameter, we just return the
-        # raw data we got from the previous line.
+        # at all times. The server may send the data gzip-compressed, which
+        # python-requests decompresses chunk by chunk while we read it.
+        response = session.get(url, stream=True)
+        response.raise_for_status()
+
+        # In general, when you work with data which size you can only guess
+        # you should never read the whole dataset into memory. Instead, you
+        # should split it up into chunks you are comfortable working with
+        # in order to keep the memory consumption under control. In this
+        # case we read at most 4 KiB.
+        #
+        # In this example this size is quite arbitrary but depending on
+        # your use-case choosing the right buffer size can be very
+        # important. You want to find the right balance between memory
+        # consumption and the overhead involved with not working with the
+        # whole dataset.
+        chunks = response.iter_content(CPI_CHUNK_SIZE)
+
+        # If we did not pass in a save_as_file parameter, we just parse the
+        # data as it comes in.
         if save_as_file is None:
-            return self.load_from_file(response.raw)
+            return self.load_from_file(_iter_lines(chunks))
 
-        # Else, we write to the desired file.
-        else:
-            # In general, when you work with data which size you can only guess
-            # you should never read the whole dataset into memory. Instead, you
-            # should split it up into chunks you are comfortable working with
-            # in order to keep the memory consumption under control. In this
-            # case we read at most 4 KiB.
-            #
-            # In this example this size is quite arbitrary but depending on
-            # your use-case choosing the right buffer size can be very
-            # important. You want to find the right balance between memory
-            # consumption and the overhead involved with not working with the
-            # whole dataset.
-            buffer_size = 4 * 1024
-            with open(save_as_file, 'wb+') as out:
-                for chunk in response.iter_content(buffer_size):
-                    out.write(chunk)
-            with open(save_as_file) as fp:
-                return self.load_from_file(fp)
+        # Else, every chunk is also written to the desired file on its way
+        # to the parser. The file only takes the place of an older one once
+        # the download is complete, so an interrupted download can't leave
+        # half a file behind.
+        temp_file = save_as_file + '.part'
+        with open(temp_file, 'wb') as out:
+            self.load_from_file(_iter_lines(_tee(chunks, out)))
+        os.rename(temp_file, save_as_file)
 
     def load_from_file(self, fp):
         """Loads CPI data from a given file-like object."""
-        # When iterating over the data file we will need a handful of temporary
-        # variables:
+        # When iterating over the data file we collect the year, month and
+        # value of every line first and only turn them into arrays at the
+        # end, once we know the time span they cover.
         reached_dataset = False
-        current_year = None
-        year_cpi = []
+        years = []
+        months = []
+        values = []
         for line in fp:
             # The actual content of the file starts with a header line
             # starting with the string "DATE ". Until we reach this line
@@ -119,54 +190,169 @@ class CPIData(object):
             # Each line ends with a new-line character which we strip here
             # to make the data easier usable.
             data = line.rstrip().split()
+            if not data:
+                continue
 
             # While we are dealing with calendar data the format is simple
             # enough that we don't really need a full date-parser. All we
-            # want is the year which can be extracted by simple string
-            # splitting:
-            year = int(data[0].split("-")[0])
-            cpi = float(data[1])
-
-            if self.first_year is None:
-                self.first_year = year
-            self.last_year = year
-
-            # The moment we reach a new year, we have to reset the CPI data
-            # and calculate the average CPI of the current_year.
-            if current_year != year:
-                if current_year is not None:
-                    self.year_cpi[current_year] = sum(year_cpi) / len(year_cpi)
-                year_cpi = []
-                current_year = year
-            year_cpi.append(cpi)
-
-        # We have to do the calculation once again for the last year in the
-        # dataset.
-        if current_year is not None and current_year not in self.year_cpi:
-            self.year_cpi[current_year] = sum(year_cpi) / len(year_cpi)
-
-    def get_adjusted_price(self, price, year, current_year=None):
+            # want is the year and the month which can be extracted by
+            # simple string splitting:
+            year, month = data[0].split("-")[:2]
+            years.append(int(year))
+            months.append(int(month))
+
+            # FRED marks months without a value with a single dot.
+            try:
+                values.append(float(data[1]))
+            except ValueError:
+                values.append(np.nan)
+
+        self._set_months(np.array(years), np.array(months),
+                         np.array(values, dtype=float))
+
+    def _set_months(self, years, months, values):
+        """Puts the CPI values of the given months into "month_cpi" and
+        calculates the yearly averages."""
+        if not len(years):
+            return
+        self.first_year = int(years.min())
+        self.last_year = int(years.max())
+
+        num_years = self.last_year - self.first_year + 1
+        self.month_cpi = np.full(num_years * 12, np.nan)
+        self.month_cpi[(years - self.first_year) * 12 + months - 1] = values
+
+        # With one row per year, the average of each year is the average
+        # of its row, leaving out the months we don't know.
+        by_year = self.month_cpi.reshape(num_years, 12)
+        known = ~np.isnan(by_year)
+        self.year_cpi_array = (np.where(known, by_year, 0).sum(axis=1) /
+                               np.maximum(known.sum(axis=1), 1))
+        self.year_cpi_array[~known.any(axis=1)] = np.nan
+
+        # The last months of the last year are usually not published yet.
+        self.last_month = int(np.flatnonzero(~np.isnan(self.month_cpi))[-1])
+
+    def save_to_cache(self, cache_file, source_file):
+        """Stores the arrays in a binary .npz file, so that the next run
+        can load them without parsing the text file again.
+
+        The size and modification time of the source file are stored
+        along with them; load_from_cache() only accepts the cache as long
+        as they didn't change.
+
+        """
+        # Like the CPI file itself, the cache only takes the place of an
+        # older one once it is complete.
+        temp_file = cache_file + '.tmp'
+        try:
+            with open(temp_file, 'wb') as out:
+                np.savez(out, month_cpi=self.month_cpi,
+                         first_year=self.first_year,
+                         source=_file_signature(source_file))
+            os.rename(temp_file, cache_file)
+        except (IOError, OSError):
+            # A cache we can't write is no reason to fail, the next run
+            # will just parse the text file again.
+            logging.debug("Can't write CPI cache {0}".format(cache_file))
+
+    def load_from_cache(self, cache_file, source_file):
+        """Loads the arrays written by save_to_cache(). Returns False if
+        there is no cache or it doesn't belong to the current version of
+        the source file."""
+        try:
+            with open(cache_file, 'rb') as f, np.load(f) as cache:
+                if str(cache['source']) != _file_signature(source_file):
+                    return False
+                month_cpi = cache['month_cpi']
+                first_year = int(cache['first_year'])
+        except (IOError, OSError, ValueError, KeyError, EOFError,
+                zipfile.BadZipfile):
+            # A damaged cache is as good as none; the text file is parsed
+            # again and the cache rewritten.
+            return False
+
+        num_years = len(month_cpi) // 12
+        years = np.repeat(np.arange(first_year, first_year + num_years), 12)
+        months = np.tile(np.arange(1, 13), num_years)
+        self._set_months(years, months, month_cpi)
+        return True
+
+    def _index(self, year, month=None):
+        """Returns the position of the given year (or year and month) in
+        "year_cpi_array" (or "month_cpi"), moving years outside of the
+        dataset to its first or last year."""
+        # If our data range doesn't provide a CPI for the given year, use
+        # the edge data.
+        index = np.clip(np.asarray(year) - self.first_year, 0,
+                        self.last_year - self.first_year)
+        if month is None:
+            return index
+        # The same goes for months after the last one we know.
+        return np.minimum(index * 12 + np.asarray(month) - 1,
+                          self.last_month)
+
+    def _cpi(self, year, month=None):
+        """Returns the CPI of a year, or of a month if given."""
+        if month is None:
+            return self.year_cpi_array[self._index(year)]
+        return self.month_cpi[self._index(year, month)]
+
+    def get_adjusted_price(self, price, year, current_year=None, month=None,
+                           current_month=None):
         """Returns the price of a purchased item from a given year compared to
         what current year has been specified.
 
-        This essentially is the calculated inflation for an item.
+        This essentially is the calculated inflation for an item. If a month
+        is given as well, the CPI of that month is used instead of the
+        average of the whole year; the same goes for current_month.
 
         """
-        # Currently there is no CPI data for 2014
-        if current_year is None or current_year > 2013:
-            current_year = 2013
+        # Without a current year we compare to the latest year we have
+        # data for.
+        if current_year is None:
+            current_year = self.last_year
+
+        return (float(price) / self._cpi(year, month) *
+                self._cpi(current_year, current_month))
+
+    def get_adjusted_prices(self, prices, years, current_year=None,
+                            months=None, current_month=None):
+        """Like get_adjusted_price(), but for whole arrays (or lists) of
+        prices and years (and months) at once. Returns a NumPy array."""
+        if current_year is None:
+            current_year = self.last_year
+
+        prices = np.asarray(prices, dtype=float)
+        return (prices / self._cpi(years, months) *
+                self._cpi(current_year, current_month))
+
+
+def _tee(chunks, out):
+    """Passes chunks of data on, writing each of them into out first."""
+    for chunk in chunks:
+        out.write(chunk)
+        yield chunk
 
-        # If our data range doesn't provide a CPI for the given year, use
-        # the edge data.
-        if year < self.first_year:
-            year = self.first_year
-        elif year > self.last_year:
-            year = self.last_year
 
-        year_cpi = self.year_cpi[year]
-        current_cpi = self.year_cpi[current_year]
+def _iter_lines(chunks):
+    """Splits chunks of bytes into lines of text (ending with "\\n")."""
+    rest = b''
+    for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        # The last piece is the start of a line that continues in the next
+        # chunk.
+        rest = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8') + u'\n'
+    if rest:
+        yield rest.decode('utf-8')
 
-        return float(price) / year_cpi * current_cpi
+
+def _file_signature(path):
+    """Describes the version of a file by its size and modification time."""
+    info = os.stat(path)
+    return '{0}:{1}'.format(info.st_size, info.st_mtime)
 
 
 class GiantbombAPI(object):
@@ -179,15 +365,66 @@ class GiantbombAPI(object):
 
     base_url = 'http://www.giantbomb.com/api'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, session=None, cache=None, revalidate=False):
         self.api_key = api_key
 
-    def get_platforms(self, sort=None, filter=None, field_list=None):
+        # All requests go through one requests.Session, which keeps the
+        # connection to the server open from one page to the next.
+        self.session = session if session is not None else default_session()
+
+        # If given, pages come out of this httpcache.ResponseCache
+        # whenever possible. With revalidate, only after the server
+        # confirmed that they are still current.
+        self.cache = cache
+        self.revalidate = revalidate
+
+    def get_platforms(self, sort=None, filter=None, field_list=None,
+                      workers=1, limit=None):
         """Generator yielding platforms matching the given criteria. If no
         limit is specified, this will return *all* platforms.
 
+        With workers > 1, the pages after the first one are fetched by that
+        many threads at the same time. The platforms are still yielded in
+        the order of the listing.
+
         """
+        params = self._params(sort, filter, field_list, limit)
+
+        # The first page tells us how many platforms there are in total.
+        result = self._get_page(params, 0)
+        num_total_results = int(result['number_of_total_results'])
+        num_wanted, offsets = self._offsets(result, limit)
+        if workers > 1 and len(offsets) > 1:
+            pages = self._get_pages_concurrently(params, offsets, workers)
+        else:
+            pages = (self._get_page(params, offset) for offset in offsets)
 
+        counter = 0
+        try:
+            for result in itertools.chain([result], pages):
+                for item in result['results']:
+                    if counter >= num_wanted:
+                        return
+                    logging.debug("Yielding platform {0} of {1}".format(
+                        counter + 1,
+                        num_total_results))
+
+                    # The "yield" keyword is what makes this a generator.
+                    # Implementing this method as generator has the
+                    # advantage that we can stop fetching of further data
+                    # from the server dynamically from the outside by simply
+                    # stop iterating over the generator.
+                    yield self._convert(item)
+                    counter += 1
+        finally:
+            # Closing the pages also stops the threads still fetching
+            # pages nobody is going to look at.
+            if hasattr(pages, 'close'):
+                pages.close()
+
+    def _params(self, sort=None, filter=None, field_list=None, limit=None):
+        """Returns the query parameters of a request for platforms, without
+        the offset."""
         # The API itself allows us to filter the data returned either
         # by requesting only a subset of data elements or a subset with each
         # data element (like only the name, the price and the release date).
@@ -202,69 +439,108 @@ class GiantbombAPI(object):
             params['sort'] = sort
         if field_list is not None:
             params['field_list'] = ','.join(field_list)
-        if filter is not None:
-            params['filter'] = filter
+        if filter:
             parsed_filters = []
-            for key, value in filter.iteritems():
+            for key, value in sorted(filter.items()):
                 parsed_filters.append('{0}:{1}'.format(key, value))
             params['filter'] = ','.join(parsed_filters)
 
+        # If we only want a few platforms, there is no point in asking for
+        # a full page of them.
+        if limit is not None:
+            params['limit'] = min(limit, PAGE_SIZE)
+
         # Last but not least we append our API key to the list of parameters
         # and tell the API that we would like to have our data being returned
         # as JSON.
         params['api_key'] = self.api_key
         params['format'] = 'json'
 
-        incomplete_result = True
-        num_total_results = None
-        num_fetched_results = 0
-        counter = 0
+        return params
 
-        while incomplete_result:
-            # Giantbomb's limit for items in a result set for this API is 100
-            # items. But given that there are more than 100 platforms in their
-            # database we will have to fetch them in more than one call.
-            #
-            # Most APIs that have such limits (and most do) offer a way to
-            # page through result sets using either a "page" or (as is here
-            # the case) an "offset" parameter which allows you to "skip" a
-            # certain number of items.
-            params['offset'] = num_fetched_results
-            result = requests.get(self.base_url + '/platforms/',
-                                  params=params)
-            result = result.json()
-            if num_total_results is None:
-                num_total_results = int(result['number_of_total_results'])
-            num_fetched_results += int(result['number_of_page_results'])
-            if num_fetched_results >= num_total_results:
-                incomplete_result = False
-            for item in result['results']:
-                logging.debug("Yielding platform {0} of {1}".format(
-                    counter + 1,
-                    num_total_results))
-
-                # Since this is supposed to be an abstraction, we also convert
-                # values here into a more useful format where appropriate.
-                if 'original_price' in item and item['original_price']:
-                    item['original_price'] = float(item['original_price'])
-
-                # The "yield" keyword is what makes this a generator.
-                # Implementing this method as generator has the advantage
-                # that we can stop fetching of further data from the server
-                # dynamically from the outside by simply stop iterating over
-                # the generator.
-                yield item
-                counter += 1
-
-
-def generate_plot(platforms, output_file):
-    """Generates a bar chart out of the given platforms and writes the output
-    into the specified file as PNG image.
+    @staticmethod
+    def _offsets(result, limit=None):
+        """Returns the number of platforms to yield and the offsets of the
+        pages after the first one, given the first page."""
+        num_total_results = int(result['number_of_total_results'])
+        page_size = int(result['number_of_page_results'])
 
-    """
+        # Giantbomb's limit for items in a result set for this API is 100
+        # items. But given that there are more than 100 platforms in their
+        # database we will have to fetch them in more than one call.
+        #
+        # Most APIs that have such limits (and most do) offer a way to
+        # page through result sets using either a "page" or (as is here
+        # the case) an "offset" parameter which allows you to "skip" a
+        # certain number of items. Knowing the total, we also know the
+        # offsets of all the remaining pages right away.
+        num_wanted = num_total_results
+        if limit is not None:
+            num_wanted = min(limit, num_total_results)
+        offsets = (range(page_size, num_wanted, page_size)
+                   if page_size else [])
+        return num_wanted, offsets
+
+    @staticmethod
+    def _convert(item):
+        """Since this is supposed to be an abstraction, we also convert
+        values here into a more useful format where appropriate."""
+        if 'original_price' in item and item['original_price']:
+            item['original_price'] = float(item['original_price'])
+        return item
+
+    def _get_page(self, params, offset):
+        """Fetches the page of platforms starting at the given offset and
+        returns the decoded JSON response."""
+        params = dict(params, offset=offset)
+        url = self.base_url + '/platforms/'
+        if self.cache is not None:
+            return self.cache.get_json(self.session, url, params,
+                                       revalidate=self.revalidate)
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def _get_pages_concurrently(self, params, offsets, workers):
+        """Generator yielding the pages at the given offsets in order,
+        while fetching up to "workers" of them at the same time.
+
+        Most of the time spent on a page is waiting for the server, so
+        threads are good enough here: while one of them waits, the others
+        can send their requests.
+
+        Pages are only requested up to "workers" pages ahead of the one
+        being yielded, so if the caller stops early, we stop sending
+        requests soon after as well.
+
+        """
+        pool = ThreadPool(min(workers, len(offsets)))
+        pending = collections.deque()
+        offsets = iter(offsets)
+        try:
+            for offset in itertools.islice(offsets, workers):
+                pending.append(pool.apply_async(self._get_page,
+                                                (params, offset)))
+            while pending:
+                # Waiting for the oldest request keeps the pages in the
+                # order of their offsets, no matter in which order the
+                # requests finish.
+                page = pending.popleft().get()
+                for offset in itertools.islice(offsets, 1):
+                    pending.append(pool.apply_async(self._get_page,
+                                                    (params, offset)))
+                yield page
+        finally:
+            pool.terminate()
+
+
+def _bars(platforms):
+    """Returns the release years, labels and values of the bars of the
+    given platforms, oldest first."""
     # First off we need to convert the platforms in a format that can be
     # attached to the 2 axis of our bar chart. "labels" will become the
     # x-axis and "values" the value of each label on the y-axis:
+    years = []
     labels = []
     values = []
     for platform in platforms:
@@ -278,33 +554,153 @@ def generate_plot(platforms, output_file):
             continue
 
         # If the name of the platform is too long, replace it with the
-        # abbreviation. list.insert(0, val) inserts val at the beginning of
-        # the list.
+        # abbreviation.
         if len(name) > 15:
             name = platform['abbreviation']
-        labels.insert(0, u"{0}\n$ {1}\n$ {2}".format(name, price,
-                                                     round(adjusted_price, 2)))
-        values.insert(0, adjusted_price)
+        years.append(platform['year'])
+        labels.append(u"{0}\n$ {1}\n$ {2}".format(name, price,
+                                                  round(adjusted_price, 2)))
+        values.append(adjusted_price)
+
+    # The platforms come newest first, but the chart should start with the
+    # oldest one. Appending and reversing once is a lot cheaper than
+    # inserting every bar at the beginning of the lists.
+    years.reverse()
+    labels.reverse()
+    values.reverse()
+    return years, labels, values
+
+
+def _pages(years, labels, values, page_size=None, facet=None):
+    """Splits the bars into pages of at most page_size bars each, and with
+    facet="decade" also into separate pages for every decade. Returns a
+    list of (title, labels, values) tuples.
+
+    For the decade facet the bars are put in the order of their years
+    first (keeping the order of bars of the same year), since every
+    decade has to be in one piece."""
+    groups = []
+    if facet == 'decade':
+        order = sorted(range(len(years)), key=years.__getitem__)
+        years = [years[index] for index in order]
+        labels = [labels[index] for index in order]
+        values = [values[index] for index in order]
+        start = 0
+        for decade, bars in itertools.groupby(years, lambda year: year // 10):
+            end = start + len(list(bars))
+            groups.append((u"{0}0s".format(decade), start, end))
+            start = end
+    # Without a facet, or without any bars to facet, all bars share one
+    # set of pages. Even no bars at all get a page, an empty chart.
+    if facet != 'decade' or not groups:
+        groups = [(None, 0, len(values))]
+
+    pages = []
+    for name, start, end in groups:
+        step = page_size or max(end - start, 1)
+        num_pages = max((end - start + step - 1) // step, 1)
+        for number in range(num_pages):
+            title = name
+            if num_pages > 1:
+                title = u"{0} {1}/{2}".format(name or u"Page", number + 1,
+                                              num_pages)
+            offset = start + number * step
+            pages.append((title, labels[offset:min(offset + step, end)],
+                          values[offset:min(offset + step, end)]))
+    return pages
+
+
+def _render_page(page):
+    """Draws one page of the bar chart into a PNG file and returns its
+    path. When rendering in parallel, this runs in another process, which
+    is why it takes a single picklable tuple of (output_file, num_bars,
+    title, labels, values)."""
+    output_file, num_bars, title, labels, values = page
 
     # Let's define the width of each bar and the size of the resulting graph.
+    # Every page has room for num_bars bars, even if it has fewer of them.
     width = 0.3
     ind = np.arange(len(values))
-    fig = plt.figure(figsize=(len(labels) * 1.8, 10))
+    fig = plt.figure(figsize=(num_bars * 1.8, 10))
 
     # Generate a subplot and put our values onto it.
     ax = fig.add_subplot(1, 1, 1)
     ax.bar(ind, values, width, align='center')
+    ax.set_xlim(-0.5, num_bars - 0.5)
+    if title:
+        ax.set_title(title)
 
     # Format the X and Y axis labels. Also set the ticks on the x-axis slightly
     # farther apart and give then a slight tilting effect.
-    plt.ylabel('Adjusted price')
-    plt.xlabel('Year / Console')
+    ax.set_ylabel('Adjusted price')
+    ax.set_xlabel('Year / Console')
     ax.set_xticks(ind + 0.3)
     ax.set_xticklabels(labels)
     fig.autofmt_xdate()
-    plt.grid(True)
+    ax.grid(True)
+
+    fig.savefig(output_file, dpi=72)
+    # pyplot keeps every figure in memory until it is closed.
+    plt.close(fig)
+    return output_file
+
 
-    plt.savefig(output_file, dpi=72)
+def _page_file(output_file, number):
+    """Returns the path of the number-th page of output_file, e.g.
+    "plot-2.png" for "plot.png"."""
+    root, ext = os.path.splitext(output_file)
+    return u"{0}-{1}{2}".format(root, number, ext)
+
+
+def generate_plot(platforms, output_file, page_size=None, facet=None,
+                  processes=1):
+    """Generates a bar chart out of the given platforms and writes the output
+    into the specified file as PNG image.
+
+    With hundreds of platforms, a single chart gets gigantic. With a
+    page_size, the chart is split into pages of at most that many bars,
+    which all have the same size, and with facet="decade" each decade gets
+    pages of its own. If there is more than one page, each of them goes
+    into a file of its own, numbered like "plot-1.png", "plot-2.png" and so
+    on. With processes > 1, up to that many pages are rendered at the same
+    time, in separate processes.
+
+    Returns the list of files written.
+
+    """
+    years, labels, values = _bars(platforms)
+    pages = _pages(years, labels, values, page_size, facet)
+
+    num_bars = page_size or max(max(len(page[2]) for page in pages), 1)
+    if len(pages) == 1:
+        files = [output_file]
+    else:
+        files = [_page_file(output_file, number)
+                 for number in range(1, len(pages) + 1)]
+    jobs = [(path, num_bars) + page for path, page in zip(files, pages)]
+
+    if processes > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(processes, len(jobs)))
+        try:
+            return pool.map(_render_page, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    return [_render_page(job) for job in jobs]
+
+
+def _open_output(output_file):
+    """Opens the file at the path output_file for writing CSV into it,
+    compressed with gzip if its name ends with ".gz"."""
+    compress = output_file.endswith('.gz')
+    if sys.version_info[0] < 3:
+        # Python 2's csv module writes bytes.
+        if compress:
+            return gzip.open(output_file, 'wb')
+        return open(output_file, 'wb')
+    if compress:
+        return gzip.open(output_file, 'wt', newline='', encoding='utf-8')
+    return open(output_file, 'w', newline='', encoding='utf-8')
 
 
 def generate_csv(platforms, output_file):
@@ -312,22 +708,53 @@ def generate_csv(platforms, output_file):
     parameter.
 
     The output_file can either be the path to a file or a file-like object.
+    A path ending with ".gz" gets a gzip-compressed file.
 
-    """
-    dataset = tablib.Dataset(headers=['Abbreviation', 'Name', 'Year', 'Price',
-                                      'Adjusted price'])
-    for p in platforms:
-        dataset.append([p['abbreviation'], p['name'], p['year'],
-                        p['original_price'], p['adjusted_price']])
+    Every platform is written as soon as it comes out of the "platforms"
+    iterable, so a generator of platforms never needs to be in memory all
+    at once.
 
+    """
     # If the output_file is a string it represents a path to a file which
     # we will have to open first for writing. Otherwise we just assume that
     # it is already a file-like object and write the data into it.
     if isinstance(output_file, basestring):
-        with open(output_file, 'w+') as fp:
-            fp.write(dataset.csv)
-    else:
-        output_file.write(dataset.csv)
+        with _open_output(output_file) as fp:
+            return generate_csv(platforms, fp)
+
+    writer = csv.writer(output_file)
+    writer.writerow([header for header, _ in OUTPUT_COLUMNS])
+    for p in platforms:
+        writer.writerow([p[name] for _, name in OUTPUT_COLUMNS])
+
+
+def generate_parquet(platforms, output_file, batch_size=BATCH_SIZE):
+    """Writes the given platforms into a Parquet file, with the columns of
+    the CSV output. This needs pyarrow.
+
+    Like generate_csv(), this doesn't need all platforms at once: they are
+    written as one row group per batch_size platforms.
+
+    """
+    if pyarrow is None:
+        raise RuntimeError("Writing Parquet files needs pyarrow")
+    schema = pyarrow.schema([('Abbreviation', pyarrow.string()),
+                             ('Name', pyarrow.string()),
+                             ('Year', pyarrow.int32()),
+                             ('Price', pyarrow.float64()),
+                             ('Adjusted price', pyarrow.float64())])
+    platforms = iter(platforms)
+    writer = pyarrow.parquet.ParquetWriter(output_file, schema)
+    try:
+        while True:
+            batch = list(itertools.islice(platforms, batch_size))
+            if not batch:
+                break
+            columns = [[p[name] for p in batch] for _, name in OUTPUT_COLUMNS]
+            writer.write_table(pyarrow.Table.from_arrays(columns,
+                                                         schema=schema))
+    finally:
+        writer.close()
 
 
 def is_valid_dataset(platform):
@@ -351,6 +778,23 @@ def is_valid_dataset(platform):
     return True
 
 
+class PlatformQuery(object):
+    """The platforms is_valid_dataset() accepts, as selected from a
+    store.PlatformStore.
+
+    - All "required" fields have to be set.
+    - The platforms are sorted by "sort", which is either "field:asc" or
+      "field:desc", like the API expects it.
+    - There are at most "limit" of them.
+
+    """
+
+    def __init__(self, required=REQUIRED_FIELDS, sort=None, limit=None):
+        self.sort = sort
+        self.limit = limit
+        self.required = list(required)
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--giantbomb-api-key', required=True,
@@ -368,17 +812,107 @@ def parse_args():
     parser.add_argument('--csv-file',
                         help='Path to CSV file which should contain the data'
                              'output')
+    parser.add_argument('--parquet-file',
+                        help='Path to the Parquet file which should contain'
+                             ' the data output (needs pyarrow)')
     parser.add_argument('--plot-file',
                         help='Path to the PNG file which should contain the'
                              'data output')
+    parser.add_argument('--plot-page-size', type=int,
+                        help='Split the plot into files of at most this many'
+                             ' platforms each')
+    parser.add_argument('--plot-facet', choices=['decade'],
+                        help='Split the plot into separate files for each'
+                             ' decade')
+    parser.add_argument('--plot-processes', type=int, default=1,
+                        help='Number of plot files rendered at the same time')
     parser.add_argument('--limit', type=int,
                         help='Number of recent platforms to be considered')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of pages of platforms fetched at the'
+                             ' same time')
+    parser.add_argument('--max-connections', type=int, default=4,
+                        help='Maximum number of requests sent to the same'
+                             ' host at the same time')
+    parser.add_argument('--retries', type=int, default=5,
+                        help='Number of times a request failing with 429 or'
+                             ' a server error is tried again')
+    parser.add_argument('--cache-dir',
+                        default=os.path.join(os.path.dirname(__file__),
+                                             '.http_cache'),
+                        help='Directory in which API responses are cached')
+    parser.add_argument('--cache-size', type=int,
+                        default=DEFAULT_MAX_SIZE // (1024 * 1024),
+                        help='Maximum size of the response cache in MiB')
+    parser.add_argument('--no-cache', default=False, action='store_true',
+                        help='Always fetch API responses from the server')
+    parser.add_argument('--store',
+                        default=os.path.join(os.path.dirname(__file__),
+                                             'platforms.sqlite'),
+                        help='Path to the SQLite file the platforms are kept'
+                             ' in between runs')
+    parser.add_argument('--no-sync', default=False, action='store_true',
+                        help="Don't fetch the platforms changed since the last"
+                             ' run, only use those in the --store')
     opts = parser.parse_args()
-    if not (opts.plot_file or opts.csv_file):
-        parser.error("You have to specify either a --csv-file or --plot-file!")
+    if not (opts.plot_file or opts.csv_file or opts.parquet_file):
+        parser.error("You have to specify either a --csv-file, --parquet-file"
+                     " or --plot-file!")
+    if opts.parquet_file and pyarrow is None:
+        parser.error("--parquet-file needs pyarrow to be installed")
     return opts
 
 
+def load_cpi_data(cpi_file, cpi_data_url=CPI_DATA_URL):
+    """Returns the CPIData from cpi_file, which is downloaded from
+    cpi_data_url first if it doesn't exist yet."""
+    cpi_data = CPIData()
+
+    # Parsing the text file is only necessary the first time. After that
+    # the arrays come straight out of the binary cache next to it.
+    cpi_cache = cpi_file + CPI_CACHE_SUFFIX
+    if not cpi_data.load_from_cache(cpi_cache, cpi_file):
+        if os.path.exists(cpi_file):
+            with open(cpi_file) as fp:
+                cpi_data.load_from_file(fp)
+        else:
+            cpi_data.load_from_url(cpi_data_url, save_as_file=cpi_file)
+        cpi_data.save_to_cache(cpi_cache, cpi_file)
+    return cpi_data
+
+
+def adjust_prices(cpi_data, platforms, batch_size=BATCH_SIZE):
+    """Generator yielding the given platforms with the "year" and "month"
+    of their release and their "adjusted_price" added.
+
+    The prices are adjusted batch_size platforms at a time, so that the
+    platforms can come from a generator without all of them ending up in
+    memory.
+
+    """
+    platforms = iter(platforms)
+    while True:
+        batch = list(itertools.islice(platforms, batch_size))
+        if not batch:
+            return
+        for platform in batch:
+            year, month = platform['release_date'].split('-')[:2]
+            platform['year'] = int(year)
+            platform['month'] = int(month)
+
+        # Calculate the current prices of the whole batch at once, comparing
+        # the CPI of the month each platform was released in with the latest
+        # CPI we have.
+        adjusted_prices = cpi_data.get_adjusted_prices(
+            [platform['original_price'] for platform in batch],
+            [platform['year'] for platform in batch],
+            months=[platform['month'] for platform in batch],
+            current_month=12)
+        for platform, adjusted_price in zip(batch, adjusted_prices.tolist()):
+            platform['adjusted_price'] = adjusted_price
+            yield platform
+
+
 def main():
     """This function handles the actual logic of this script."""
     opts = parse_args()
@@ -388,54 +922,67 @@ def main():
     else:
         logging.basicConfig(level=logging.INFO)
 
-    cpi_data = CPIData()
-    gb_api = GiantbombAPI(opts.giantbomb_api_key)
+    # Both clients share one session, and with it its connections and
+    # limits.
+    set_default_session(create_session(max_per_host=opts.max_connections,
+                                       retries=opts.retries))
+
+    # The sync has to see every change, so cached pages are only used once
+    # the server confirmed them ("304 Not Modified"), no matter how young
+    # they are. That still saves downloading pages that didn't change.
+    cache = None
+    if not opts.no_cache:
+        cache = ResponseCache(opts.cache_dir,
+                              max_size=opts.cache_size * 1024 * 1024)
 
     print ("Disclaimer: This script uses data provided by FRED, Federal"
            " Reserve Economic Data, from the Federal Reserve Bank of St. Louis"
            " and Giantbomb.com:\n- {0}\n- http://www.giantbomb.com/api/\n"
            .format(CPI_DATA_URL))
 
-    if os.path.exists(opts.cpi_file):
-        with open(opts.cpi_file) as fp:
-            cpi_data.load_from_file(fp)
+    # Now that we have everything in place, bring our local copy of the
+    # platforms up to date. Only the platforms that changed since the last
+    # run are fetched, so after the first run this takes a request or two.
+    store = PlatformStore(opts.store)
+    gb_api = None
+    if sys.version_info >= (3, 7):
+        # Loading the CPI data and syncing the platforms are two unrelated
+        # waits for the network, which asyncio lets us wait for at the same
+        # time (see async_api.py).
+        from async_api import AsyncGiantbombAPI, sync_concurrently
+        if not opts.no_sync:
+            gb_api = AsyncGiantbombAPI(opts.giantbomb_api_key, cache=cache,
+                                       revalidate=True)
+        cpi_data = sync_concurrently(gb_api, store, opts.cpi_file,
+                                     opts.cpi_data_url, opts.workers)
     else:
-        cpi_data.load_from_url(opts.cpi_data_url, save_as_file=opts.cpi_file)
-
-    platforms = []
-    counter = 0
-
-    # Now that we have everything in place, fetch the platforms and calculate
-    # their current price in relation to the CPI value.
-    for platform in gb_api.get_platforms(sort='release_date:desc',
-                                         field_list=['release_date',
-                                                     'original_price', 'name',
-                                                     'abbreviation']):
-        # Some platforms don't have a release date or price yet. These we have
-        # to skip.
-        if not is_valid_dataset(platform):
-            continue
-
-        year = int(platform['release_date'].split('-')[0])
-        price = platform['original_price']
-        adjusted_price = cpi_data.get_adjusted_price(price, year)
-        platform['year'] = year
-        platform['original_price'] = price
-        platform['adjusted_price'] = adjusted_price
-        platforms.append(platform)
-
-        # We limit the resultset on this end since we can only here check
-        # if the dataset actually contains all the data we need and therefor
-        # can't filter on the API level.
-        if opts.limit is not None and counter + 1 >= opts.limit:
-            break
-        counter += 1
-
-    if opts.plot_file:
-        generate_plot(platforms, opts.plot_file)
-    if opts.csv_file:
-        generate_csv(platforms, opts.csv_file)
-
+        if not opts.no_sync:
+            gb_api = GiantbombAPI(opts.giantbomb_api_key, cache=cache,
+                                  revalidate=True)
+            store.sync(gb_api, workers=opts.workers)
+        cpi_data = load_cpi_data(opts.cpi_file, opts.cpi_data_url)
+
+    # Then select the platforms from the store and calculate their current
+    # price in relation to the CPI value. The query takes care of skipping
+    # platforms without a release date or price, and of stopping once we
+    # have --limit of them. As it is cheap, every output runs it anew and
+    # writes the platforms as they come out of the store, instead of all of
+    # them being kept in a list.
+    query = PlatformQuery(sort='release_date:desc', limit=opts.limit)
+    try:
+        if opts.plot_file:
+            generate_plot(adjust_prices(cpi_data, store.platforms(query)),
+                          opts.plot_file, page_size=opts.plot_page_size,
+                          facet=opts.plot_facet,
+                          processes=opts.plot_processes)
+        if opts.csv_file:
+            generate_csv(adjust_prices(cpi_data, store.platforms(query)),
+                         opts.csv_file)
+        if opts.parquet_file:
+            generate_parquet(adjust_prices(cpi_data, store.platforms(query)),
+                             opts.parquet_file)
+    finally:
+        store.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,286 @@
+import csv
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import api
+from api import (CPIData, GiantbombAPI, generate_csv, generate_parquet,
+                 load_cpi_data)
+from session import create_session
+from stubserver import StubServer, make_platforms
+
+
+def later_pages_first(params):
+    """Latency making pages with a larger offset answer sooner."""
+    return max(0.2 - int(params.get('offset', 0)) / 1000.0, 0)
+
+
+class TestGetPlatforms(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(make_platforms(1000)).start()
+        self.gb_api = GiantbombAPI('key', session=create_session(retries=0))
+        self.gb_api.base_url = self.server.base_url
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_it_yields_all_platforms_in_order(self):
+        platforms = list(self.gb_api.get_platforms(sort='id:asc'))
+        self.assertEqual([platform['id'] for platform in platforms],
+                         list(range(1000)))
+        self.assertEqual(len(self.server.requests), 10)
+
+    def test_concurrent_pages_keep_their_order(self):
+        self.server.latency = later_pages_first
+        platforms = list(self.gb_api.get_platforms(sort='id:asc', workers=4))
+        self.assertEqual([platform['id'] for platform in platforms],
+                         list(range(1000)))
+        self.assertEqual(len(self.server.requests), 10)
+
+    def test_it_stops_fetching_when_closed_early(self):
+        platforms = self.gb_api.get_platforms(sort='id:asc', workers=2)
+        for _ in range(150):
+            next(platforms)
+        platforms.close()
+        # Give requests that were already on their way time to arrive.
+        time.sleep(0.3)
+        # The first page, and at most three more: two requested ahead of
+        # the second page, and one more once it arrived.
+        self.assertLessEqual(len(self.server.requests), 4)
+
+    def test_limit_asks_for_one_small_page(self):
+        platforms = list(self.gb_api.get_platforms(sort='id:asc', limit=10,
+                                                   workers=4))
+        self.assertEqual([platform['id'] for platform in platforms],
+                         list(range(10)))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0]['limit'], '10')
+
+    def test_it_converts_prices(self):
+        platforms = self.gb_api.get_platforms(sort='id:asc', limit=2)
+        self.assertEqual([platform['original_price']
+                          for platform in platforms], [None, 101.0])
+
+
+CPI_FILE = u"""Title: Consumer Price Index
+DATE         VALUE
+1990-01-01   100.0
+1990-02-01   110.0
+1991-01-01   120.0
+1991-12-01   140.0
+"""
+
+
+class TestCPIData(unittest.TestCase):
+    def setUp(self):
+        self.cpi_data = CPIData()
+        self.cpi_data.load_from_file(io.StringIO(CPI_FILE))
+
+    def test_year_cpi_is_keyed_by_year(self):
+        self.assertEqual(self.cpi_data.year_cpi, {1990: 105.0, 1991: 130.0})
+        self.assertEqual(self.cpi_data.year_cpi_array.tolist(), [105.0, 130.0])
+
+    def test_adjusted_prices(self):
+        self.assertAlmostEqual(
+            self.cpi_data.get_adjusted_price(105, 1990, 1991), 130.0)
+        # Years outside of the dataset use its first or last year.
+        self.assertAlmostEqual(
+            self.cpi_data.get_adjusted_price(105, 1980, 2000), 130.0)
+        self.assertAlmostEqual(
+            self.cpi_data.get_adjusted_price(100, 1990, 1991, month=1,
+                                             current_month=12), 140.0)
+
+
+class TestPages(unittest.TestCase):
+    def setUp(self):
+        self.years = [1977, 1982, 1985, 1989, 1991, 1994, 1994]
+        self.labels = [u'Bar {0}'.format(number) for number in range(7)]
+        self.values = [float(number) for number in range(7)]
+
+    def pages(self, **kwargs):
+        return api._pages(self.years, self.labels, self.values, **kwargs)
+
+    def test_one_page_without_a_page_size(self):
+        self.assertEqual(self.pages(), [(None, self.labels, self.values)])
+
+    def test_page_size(self):
+        pages = self.pages(page_size=3)
+        self.assertEqual([title for title, _, _ in pages],
+                         [u'Page 1/3', u'Page 2/3', u'Page 3/3'])
+        self.assertEqual([values for _, _, values in pages],
+                         [[0.0, 1.0, 2.0], [3.0, 4.0, 5.0], [6.0]])
+        self.assertEqual(self.pages(page_size=7),
+                         [(None, self.labels, self.values)])
+
+    def test_no_bars(self):
+        for facet in (None, 'decade'):
+            self.assertEqual(api._pages([], [], [], page_size=3,
+                                        facet=facet), [(None, [], [])])
+
+    def test_decades(self):
+        pages = self.pages(page_size=2, facet='decade')
+        self.assertEqual([(title, values) for title, _, values in pages],
+                         [(u'1970s', [0.0]),
+                          (u'1980s 1/2', [1.0, 2.0]),
+                          (u'1980s 2/2', [3.0]),
+                          (u'1990s 1/2', [4.0, 5.0]),
+                          (u'1990s 2/2', [6.0])])
+        self.assertEqual(pages[-1][1], [u'Bar 6'])
+
+    def test_decades_of_unsorted_years(self):
+        self.years.reverse()
+        pages = self.pages(facet='decade')
+        # Every decade gets one page, its bars in the order of their years.
+        self.assertEqual([(title, values) for title, _, values in pages],
+                         [(u'1970s', [6.0]),
+                          (u'1980s', [5.0, 4.0, 3.0]),
+                          (u'1990s', [2.0, 0.0, 1.0])])
+
+
+def make_output_platforms(count):
+    """Yields platforms with all fields the outputs need, one by one."""
+    for number in range(count):
+        yield {'abbreviation': u'P{0}'.format(number),
+               'name': u'Platform, "{0}"'.format(number),
+               'year': 1990 + number, 'original_price': 100.0 + number,
+               'adjusted_price': 200.5 + number}
+
+
+OUTPUT_ROWS = [[u'Abbreviation', u'Name', u'Year', u'Price',
+                u'Adjusted price'],
+               [u'P0', u'Platform, "0"', u'1990', u'100.0', u'200.5'],
+               [u'P1', u'Platform, "1"', u'1991', u'101.0', u'201.5'],
+               [u'P2', u'Platform, "2"', u'1992', u'102.0', u'202.5']]
+
+
+class TestOutput(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_csv_from_a_generator(self):
+        out = io.StringIO()
+        generate_csv(make_output_platforms(3), out)
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+        self.assertEqual(rows, OUTPUT_ROWS)
+
+    def test_gzip_csv(self):
+        path = os.path.join(self.directory, 'platforms.csv.gz')
+        generate_csv(make_output_platforms(3), path)
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(list(csv.reader(f)), OUTPUT_ROWS)
+
+    @unittest.skipIf(api.pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        path = os.path.join(self.directory, 'platforms.parquet')
+        generate_parquet(make_output_platforms(5), path, batch_size=2)
+        parquet_file = api.pyarrow.parquet.ParquetFile(path)
+        # One row group per batch.
+        self.assertEqual(parquet_file.num_row_groups, 3)
+        table = parquet_file.read().to_pydict()
+        self.assertEqual(table['Year'], [1990, 1991, 1992, 1993, 1994])
+        self.assertEqual(table['Name'][0], u'Platform, "0"')
+        self.assertEqual(table['Adjusted price'][4], 204.5)
+
+
+def make_cpi_file(years):
+    """Returns a FRED CPI file with a value for every month of the given
+    number of years, starting with 1950."""
+    lines = [u'Title: Consumer Price Index', u'DATE         VALUE']
+    for month in range(years * 12):
+        lines.append(u'{0}-{1:02d}-01   {2:.1f}'.format(
+            1950 + month // 12, 1 + month % 12, 20.0 + month / 10.0))
+    return u'\n'.join(lines) + u'\n'
+
+
+class TestCPIDownload(unittest.TestCase):
+    def setUp(self):
+        self.text = make_cpi_file(30)
+        self.server = StubServer(
+            files={'/api/cpi.txt': self.text.encode('utf-8')}).start()
+        self.url = self.server.base_url + '/cpi.txt'
+        self.session = create_session(retries=0)
+        self.directory = tempfile.mkdtemp()
+        # Tiny chunks split most lines in two or more.
+        self.chunk_size = api.CPI_CHUNK_SIZE
+        api.CPI_CHUNK_SIZE = 7
+
+    def tearDown(self):
+        api.CPI_CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.directory)
+        self.server.stop()
+
+    def check(self, cpi_data):
+        expected = CPIData()
+        expected.load_from_file(io.StringIO(self.text))
+        self.assertEqual(cpi_data.first_year, 1950)
+        self.assertEqual(cpi_data.last_year, 1979)
+        self.assertEqual(cpi_data.month_cpi.tolist(),
+                         expected.month_cpi.tolist())
+
+    def test_gzip_download_is_parsed_while_streaming(self):
+        cpi_data = CPIData()
+        cpi_data.load_from_url(self.url, session=self.session)
+        self.check(cpi_data)
+
+    def test_download_is_saved_once_complete(self):
+        cpi_file = os.path.join(self.directory, 'CPIAUCSL.txt')
+        cpi_data = CPIData()
+        cpi_data.load_from_url(self.url, save_as_file=cpi_file,
+                               session=self.session)
+        self.check(cpi_data)
+        # The ".part" file took the place of the final one, and holds the
+        # text itself, not the compressed download.
+        self.assertEqual(os.listdir(self.directory), ['CPIAUCSL.txt'])
+        with io.open(cpi_file, encoding='utf-8') as f:
+            self.assertEqual(f.read(), self.text)
+
+
+class TestCPICache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cpi_file = os.path.join(self.directory, 'CPIAUCSL.txt')
+        self.cache_file = self.cpi_file + '.npz'
+        with io.open(self.cpi_file, 'w') as out:
+            out.write(CPI_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        cpi_data = load_cpi_data(self.cpi_file)
+        # No temporary file is left behind.
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['CPIAUCSL.txt', 'CPIAUCSL.txt.npz'])
+        cached = CPIData()
+        self.assertTrue(cached.load_from_cache(self.cache_file,
+                                               self.cpi_file))
+        self.assertEqual(cached.year_cpi, cpi_data.year_cpi)
+        self.assertEqual(cached.last_month, cpi_data.last_month)
+
+    def test_corrupt_cache_is_rewritten(self):
+        load_cpi_data(self.cpi_file)
+        with open(self.cache_file, 'r+b') as f:
+            f.truncate(os.path.getsize(self.cache_file) // 2)
+        self.assertFalse(CPIData().load_from_cache(self.cache_file,
+                                                   self.cpi_file))
+        # The text file is parsed again, and the cache replaced.
+        cpi_data = load_cpi_data(self.cpi_file)
+        self.assertEqual(cpi_data.year_cpi, {1990: 105.0, 1991: 130.0})
+        self.assertTrue(CPIData().load_from_cache(self.cache_file,
+                                                  self.cpi_file))
+
+        with open(self.cache_file, 'wb'):
+            pass
+        self.assertFalse(CPIData().load_from_cache(self.cache_file,
+                                                   self.cpi_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
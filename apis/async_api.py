@@ -0,0 +1,113 @@
+"""
+Asyncio variants of the API clients in api.py.
+
+Loading the CPI data and syncing the platforms both spend nearly all of
+their time waiting for a server. Done one after the other, a run takes
+as long as both waits together; with asyncio, main() waits for both at
+the same time, which takes about as long as the longer of the two.
+
+The requests themselves still go through the requests session of
+api.py, with its connection pool, retries and response cache: each one
+is sent from a worker thread of the event loop, and the coroutines
+below only wait for it to finish. This needs Python 3.7 or newer, which
+is why it lives in a module of its own, while api.py keeps working on
+Python 2.
+"""
+import asyncio
+import collections
+import logging
+
+from api import GiantbombAPI, load_cpi_data
+
+
+class AsyncGiantbombAPI(GiantbombAPI):
+    """GiantbombAPI whose get_platforms() is an async generator."""
+
+    async def _get_page_async(self, params, offset):
+        """Fetches a page in a worker thread and waits for it."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._get_page, params,
+                                          offset)
+
+    async def get_platforms(self, sort=None, filter=None, field_list=None,
+                            workers=1, limit=None):
+        """Async generator yielding platforms matching the given criteria,
+        just like GiantbombAPI.get_platforms().
+
+        Up to "workers" pages are requested at the same time, ahead of the
+        one being yielded.
+
+        """
+        params = self._params(sort, filter, field_list, limit)
+
+        # The first page tells us how many platforms there are in total.
+        result = await self._get_page_async(params, 0)
+        num_wanted, offsets = self._offsets(result, limit)
+        offsets = iter(offsets)
+
+        pending = collections.deque()
+        counter = 0
+        try:
+            while True:
+                # Keep up to "workers" requests going while we hand out the
+                # platforms of the current page.
+                for offset in offsets:
+                    pending.append(asyncio.ensure_future(
+                        self._get_page_async(params, offset)))
+                    if len(pending) >= max(workers, 1):
+                        break
+
+                for item in result['results']:
+                    if counter >= num_wanted:
+                        return
+                    yield self._convert(item)
+                    counter += 1
+
+                if not pending:
+                    return
+                result = await pending.popleft()
+        finally:
+            # Whoever stopped iterating doesn't need the pages that are
+            # still on their way.
+            for request in pending:
+                request.cancel()
+
+
+async def load_cpi_data_async(cpi_file, cpi_data_url):
+    """Coroutine returning the CPIData loaded by api.load_cpi_data()."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, load_cpi_data, cpi_file,
+                                      cpi_data_url)
+
+
+async def sync_store(gb_api, store, workers=1):
+    """Coroutine fetching the platforms changed since the last sync into a
+    store.PlatformStore, like PlatformStore.sync(). Returns their number."""
+    platforms = gb_api.get_platforms(workers=workers,
+                                     **store.sync_arguments())
+    count = store.upsert([platform async for platform in platforms])
+    logging.info("Synced {0} platforms into {1}".format(count, store.path))
+    return count
+
+
+async def sync_and_load_cpi(gb_api, store, cpi_file, cpi_data_url,
+                            workers=1):
+    """Coroutine loading the CPI data while syncing the platforms in the
+    store. Returns the CPIData. Without a gb_api, only the CPI data is
+    loaded."""
+    cpi_task = asyncio.ensure_future(load_cpi_data_async(cpi_file,
+                                                         cpi_data_url))
+    if gb_api is not None:
+        try:
+            await sync_store(gb_api, store, workers)
+        except Exception:
+            cpi_task.cancel()
+            raise
+    return await cpi_task
+
+
+def sync_concurrently(gb_api, store, cpi_file, cpi_data_url, workers=1):
+    """Runs sync_and_load_cpi() to completion. gb_api has to be an
+    AsyncGiantbombAPI, or None."""
+    return asyncio.run(sync_and_load_cpi(gb_api, store, cpi_file,
+                                         cpi_data_url, workers))
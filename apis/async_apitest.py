@@ -0,0 +1,62 @@
+import asyncio
+import time
+import unittest
+
+from apitest import later_pages_first
+from async_api import AsyncGiantbombAPI
+from session import create_session
+from stubserver import StubServer, make_platforms
+
+
+async def take(platforms, count=None):
+    """Collects count platforms (or all of them) from an async generator,
+    then closes it."""
+    taken = []
+    try:
+        async for platform in platforms:
+            taken.append(platform)
+            if count is not None and len(taken) >= count:
+                break
+    finally:
+        await platforms.aclose()
+    return taken
+
+
+class TestAsyncGetPlatforms(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(make_platforms(1000)).start()
+        self.gb_api = AsyncGiantbombAPI('key',
+                                        session=create_session(retries=0))
+        self.gb_api.base_url = self.server.base_url
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_concurrent_pages_keep_their_order(self):
+        self.server.latency = later_pages_first
+        platforms = asyncio.run(take(self.gb_api.get_platforms(
+            sort='id:asc', workers=4)))
+        self.assertEqual([platform['id'] for platform in platforms],
+                         list(range(1000)))
+        self.assertEqual(len(self.server.requests), 10)
+
+    def test_it_stops_fetching_when_closed_early(self):
+        platforms = asyncio.run(take(self.gb_api.get_platforms(
+            sort='id:asc', workers=2), 150))
+        self.assertEqual(len(platforms), 150)
+        # Give requests that were already on their way time to arrive.
+        time.sleep(0.3)
+        # The first page, two requested ahead of the second one, and one
+        # more once it arrived.
+        self.assertLessEqual(len(self.server.requests), 4)
+
+    def test_limit(self):
+        platforms = asyncio.run(take(self.gb_api.get_platforms(
+            sort='id:asc', limit=10, workers=4)))
+        self.assertEqual([platform['id'] for platform in platforms],
+                         list(range(10)))
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+"""
+An on-disk cache of JSON API responses.
+
+The Giantbomb platform catalogue hardly ever changes, so downloading all
+of its pages on every run is mostly a waste of time and of API quota.
+Instead, every response is written into a small file of its own,
+together with the time it was fetched and the "ETag" and
+"Last-Modified" headers the server sent along.
+
+- As long as a response is younger than the time to live (TTL), it is
+  used as it is, without asking the server at all.
+- Once it is older, we ask the server whether it changed since, by
+  sending its ETag ("If-None-Match") and date ("If-Modified-Since").  If
+  it didn't, the server answers "304 Not Modified" without a body and
+  the cached response is good for another TTL.
+- If all cached responses together get larger than the size limit, the
+  least recently used ones are thrown away.
+
+Responses are keyed by their URL and query parameters, leaving out the
+API key: the answer doesn't depend on who is asking, and the key doesn't
+belong on disk.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+# Query parameters that are not part of the cache key.
+IGNORED_PARAMS = ('api_key',)
+
+# Defaults of ResponseCache
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+
+# Extension of the files holding cached responses.
+ENTRY_SUFFIX = '.json'
+
+
+class ResponseCache(object):
+    """Caches JSON responses in a directory, for "ttl" seconds and up to
+    "max_size" bytes in total."""
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+
+        # Size of all entries together, as far as we know. It is counted
+        # once, on the first write, and then kept up to date by every
+        # write, so that the directory is only listed again once there is
+        # something to evict.
+        self._size = None
+
+        # Number of responses served from the cache without asking the
+        # server ("hits"), after the server confirmed them ("revalidated")
+        # and fetched anew ("misses").
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+
+    def key(self, url, params=None):
+        """Returns the name of the cache entry of a request."""
+        params = sorted((name, str(value))
+                        for name, value in (params or {}).items()
+                        if name not in IGNORED_PARAMS)
+        request = json.dumps([url, params])
+        return hashlib.sha1(request.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def _read(self, key):
+        """Returns the cache entry with the given key, or None."""
+        try:
+            with open(self._path(key)) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write(self, key, entry):
+        """Stores an entry, replacing the previous one only once the new
+        one is complete."""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = self._path(key)
+        # Pages are fetched by several threads (and maybe processes) at
+        # once, so each of them needs a temporary file of its own.
+        temp_path = '{0}.{1}.{2}.tmp'.format(path, os.getpid(),
+                                             threading.current_thread().ident)
+        with open(temp_path, 'w') as fp:
+            json.dump(entry, fp)
+        size = os.path.getsize(temp_path)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.rename(temp_path, path)
+
+        if self._size is None:
+            self.evict()
+        else:
+            self._size += size - replaced
+            if self._size > self.max_size:
+                self.evict()
+
+    def _touch(self, key):
+        """Marks an entry as just used. The modification time of the file
+        is what the LRU eviction goes by."""
+        try:
+            os.utime(self._path(key), None)
+        except (IOError, OSError):
+            pass
+
+    def get_json(self, session, url, params=None, revalidate=False):
+        """Returns the decoded JSON response to a GET request, from the
+        cache if possible. Requests go through the given session.
+
+        With revalidate, even a response younger than the TTL is only used
+        once the server confirmed that it didn't change.
+
+        """
+        key = self.key(url, params)
+        entry = self._read(key)
+
+        if (entry is not None and not revalidate and
+                time.time() - entry['fetched'] < self.ttl):
+            self.stats['hits'] += 1
+            self._touch(key)
+            return entry['body']
+
+        # Ask the server to only send the response if it changed.
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = session.get(url, params=params, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            logging.debug("Cached response for {0} is still valid".format(url))
+            self.stats['revalidated'] += 1
+            entry['fetched'] = time.time()
+        else:
+            response.raise_for_status()
+            self.stats['misses'] += 1
+            entry = {'url': url,
+                     'fetched': time.time(),
+                     'etag': response.headers.get('ETag'),
+                     'last_modified': response.headers.get('Last-Modified'),
+                     'body': response.json()}
+        try:
+            self._write(key, entry)
+        except (IOError, OSError):
+            # Not being able to cache a response is no reason to fail.
+            logging.debug("Can't cache response for {0}".format(url))
+        return entry['body']
+
+    def evict(self):
+        """Removes the least recently used entries until all of them
+        together fit into max_size."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, name))
+            total += info.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                # Another thread got there first.
+                pass
+            total -= size
+        self._size = total
+
+    def clear(self):
+        """Removes all entries."""
+        max_size, self.max_size = self.max_size, -1
+        try:
+            if os.path.isdir(self.directory):
+                self.evict()
+        finally:
+            self.max_size = max_size
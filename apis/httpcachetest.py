@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from httpcache import ResponseCache
+from session import create_session
+from stubserver import StubServer, make_platforms
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = StubServer(make_platforms(300)).start()
+        self.session = create_session(retries=0)
+        self.url = self.server.base_url + '/platforms/'
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def get(self, cache, offset=0, api_key='key', revalidate=False):
+        return cache.get_json(self.session, self.url,
+                              {'api_key': api_key, 'format': 'json',
+                               'offset': offset}, revalidate=revalidate)
+
+    def entries(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_fresh_responses_are_hits(self):
+        cache = ResponseCache(self.directory)
+        first = self.get(cache)
+        self.assertEqual(self.get(cache), first)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(cache.stats,
+                         {'hits': 1, 'revalidated': 0, 'misses': 1})
+
+    def test_stale_responses_are_revalidated(self):
+        cache = ResponseCache(self.directory, ttl=0)
+        first = self.get(cache)
+        self.assertEqual(self.get(cache), first)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(cache.stats['revalidated'], 1)
+
+        # A changed response is fetched anew.
+        self.server.platforms[0]['name'] = 'Renamed'
+        changed = self.get(cache)
+        self.assertEqual(changed['results'][0]['name'], 'Renamed')
+        self.assertEqual(cache.stats['misses'], 2)
+
+    def test_revalidate_skips_the_ttl(self):
+        cache = ResponseCache(self.directory)
+        self.get(cache)
+        self.get(cache, revalidate=True)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(cache.stats['revalidated'], 1)
+
+    def test_api_key_is_not_part_of_the_key(self):
+        cache = ResponseCache(self.directory)
+        self.assertEqual(cache.key(self.url, {'api_key': 'a', 'offset': 1}),
+                         cache.key(self.url, {'api_key': 'b', 'offset': 1}))
+        self.assertNotEqual(cache.key(self.url, {'offset': 1}),
+                            cache.key(self.url, {'offset': 2}))
+        self.get(cache, api_key='secret-one')
+        self.get(cache, api_key='secret-two')
+        self.assertEqual(len(self.server.requests), 1)
+        for name in self.entries():
+            with open(os.path.join(self.directory, name)) as f:
+                self.assertNotIn('secret', f.read())
+
+    def test_least_recently_used_are_evicted(self):
+        cache = ResponseCache(self.directory)
+        self.get(cache, offset=0)
+        size = os.path.getsize(os.path.join(self.directory,
+                                            self.entries()[0]))
+        # Room for two entries of about the same size.
+        cache.max_size = size * 5 // 2
+        self.get(cache, offset=100)
+        first, second = [cache._path(cache.key(self.url, {'offset': offset,
+                                                          'format': 'json'}))
+                         for offset in (0, 100)]
+        now = time.time()
+        os.utime(first, (now - 100, now - 100))
+        os.utime(second, (now - 50, now - 50))
+
+        # Using the first entry makes the second one the oldest.
+        self.get(cache, offset=0)
+        self.get(cache, offset=200)
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+        self.assertEqual(len(self.entries()), 2)
+
+    def test_directory_is_only_listed_to_evict(self):
+        cache = ResponseCache(self.directory)
+        evictions = []
+        evict = cache.evict
+        cache.evict = lambda: evictions.append(evict())
+        for offset in range(0, 300, 100):
+            self.get(cache, offset=offset)
+        # Once to learn the size of the cache, and no more while it fits.
+        self.assertEqual(len(evictions), 1)
+
+        cache.max_size = 0
+        self.get(cache, offset=0, revalidate=True)
+        self.assertEqual(len(evictions), 2)
+        self.assertEqual(self.entries(), [])
+
+    def test_no_temporary_files_are_left(self):
+        cache = ResponseCache(self.directory)
+        for offset in range(0, 300, 100):
+            self.get(cache, offset=offset)
+        self.assertTrue(all(name.endswith('.json')
+                            for name in self.entries()))
+
+
+if __name__ == '__main__':
+    unittest.main()
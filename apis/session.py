@@ -0,0 +1,84 @@
+"""
+A shared HTTP session for the API clients in api.py.
+
+Calling requests.get() opens a new connection (and, for HTTPS, does a
+new TLS handshake) for every single request. A requests.Session instead
+keeps connections open and reuses them for the next request to the same
+host, which saves a round trip or two per page when we fetch many pages.
+
+The session created here also
+
+- retries requests that failed with "429 Too Many Requests" or a 5xx
+  server error, waiting longer after every attempt (and as long as the
+  server asks for with a "Retry-After" header), and
+- never has more than a given number of requests in flight to the same
+  host, so that fetching pages from many threads doesn't get us
+  throttled.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    # Older versions of requests bring their own copy of urllib3.
+    from requests.packages.urllib3.util.retry import Retry
+
+
+# Status codes worth trying again: the server is either overloaded or
+# asks us to slow down.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Defaults of create_session()
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_PER_HOST = 4
+
+# Number of hosts whose connections are kept open at the same time.
+POOL_HOSTS = 10
+
+
+def create_session(max_per_host=DEFAULT_MAX_PER_HOST,
+                   retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF):
+    """Returns a requests.Session with connection pooling, retries and a
+    limit of max_per_host concurrent requests per host.
+
+    A failed request is tried again up to "retries" times, waiting
+    backoff_factor * 2 ** (attempt - 1) seconds in between.
+
+    """
+    retry = Retry(total=retries, connect=retries, read=retries,
+                  status=retries, backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUSES)
+
+    # Each host gets a pool of at most max_per_host connections. With
+    # pool_block, a thread that wants to send a request while all of them
+    # are busy waits for one to become free instead of opening another
+    # one, which is what limits the number of requests per host.
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS,
+                          pool_maxsize=max_per_host, pool_block=True,
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# The session used by everything in this process, created on first use.
+_session = None
+
+
+def default_session():
+    """Returns the session shared by all API clients of this process."""
+    global _session
+    if _session is None:
+        _session = create_session()
+    return _session
+
+
+def set_default_session(session):
+    """Replaces the shared session, e.g. by one with other limits."""
+    global _session
+    _session = session
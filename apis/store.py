@@ -0,0 +1,127 @@
+"""
+A local copy of the Giantbomb platform catalogue in an SQLite database.
+
+Crawling the whole catalogue on every run takes dozens of requests,
+even though only a handful of platforms change between two runs. The
+PlatformStore keeps all platforms in a local database instead, and
+sync() only asks the API for the platforms that were updated since the
+most recent "date_last_updated" in the database, sorted by that date.
+Those are then inserted, or replace their older versions.
+
+Reports are then plain SQL queries over the local copy, which take
+milliseconds.
+"""
+
+import logging
+import sqlite3
+
+
+# Fields of a platform kept in the store.
+FIELDS = ('id', 'name', 'abbreviation', 'release_date', 'original_price',
+          'date_last_updated')
+
+# Latest date the API understands; the end of the date range synced.
+END_OF_TIME = '9999-12-31 23:59:59'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS platforms (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    abbreviation TEXT,
+    release_date TEXT,
+    original_price REAL,
+    date_last_updated TEXT
+);
+CREATE INDEX IF NOT EXISTS platforms_release_date
+    ON platforms (release_date);
+CREATE INDEX IF NOT EXISTS platforms_date_last_updated
+    ON platforms (date_last_updated);
+'''
+
+
+class PlatformStore(object):
+    """The platforms of the Giantbomb API, stored in an SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def last_updated(self):
+        """Returns the most recent "date_last_updated" of all platforms in
+        the store, or None if it is empty."""
+        row = self.connection.execute(
+            'SELECT MAX(date_last_updated) FROM platforms').fetchone()
+        return row[0]
+
+    def sync_arguments(self):
+        """Returns the keyword arguments for GiantbombAPI.get_platforms()
+        fetching everything that changed since the last sync.
+
+        The platforms updated exactly at the last "date_last_updated" are
+        fetched again, in case some of them weren't in the store yet;
+        storing them a second time does no harm.
+
+        """
+        arguments = {'sort': 'date_last_updated:asc',
+                     'field_list': list(FIELDS)}
+        since = self.last_updated()
+        if since is not None:
+            arguments['filter'] = {
+                'date_last_updated': '{0}|{1}'.format(since, END_OF_TIME)}
+        return arguments
+
+    def upsert(self, platforms):
+        """Inserts the given platforms, replacing the stored versions of
+        those already in the store. Returns their number."""
+        rows = ([platform.get(name) for name in FIELDS]
+                for platform in platforms)
+        with self.connection:
+            cursor = self.connection.executemany(
+                'INSERT OR REPLACE INTO platforms ({0}) VALUES ({1})'.format(
+                    ', '.join(FIELDS), ', '.join('?' for _ in FIELDS)),
+                rows)
+        return cursor.rowcount
+
+    def sync(self, gb_api, workers=1):
+        """Fetches the platforms changed since the last sync from a
+        GiantbombAPI and stores them. Returns their number."""
+        count = self.upsert(gb_api.get_platforms(workers=workers,
+                                                 **self.sync_arguments()))
+        logging.info("Synced {0} platforms into {1}".format(count, self.path))
+        return count
+
+    def platforms(self, query):
+        """Generator yielding the stored platforms matching an
+        api.PlatformQuery, as dicts.
+
+        The fields the query requires have to be set, the platforms are
+        sorted like the query asks the API to, and there are at most
+        "limit" of them.
+
+        """
+        sql = 'SELECT {0} FROM platforms'.format(', '.join(FIELDS))
+        # Like is_valid_dataset(), an empty name or a price of 0 counts as
+        # not set.
+        conditions = ["{0} IS NOT NULL AND {0} NOT IN ('', 0)".format(name)
+                      for name in query.required if name in FIELDS]
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if query.sort:
+            # The API sorts by "field:asc" or "field:desc".
+            name, _, direction = query.sort.partition(':')
+            if name not in FIELDS:
+                raise ValueError("Can't sort by {0}".format(name))
+            sql += ' ORDER BY {0} {1}, id'.format(
+                name, 'DESC' if direction == 'desc' else 'ASC')
+        parameters = ()
+        if query.limit is not None:
+            sql += ' LIMIT ?'
+            parameters = (query.limit,)
+
+        for row in self.connection.execute(sql, parameters):
+            yield dict(zip(row.keys(), row))
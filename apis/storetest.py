@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from api import GiantbombAPI, PlatformQuery
+from httpcache import ResponseCache
+from session import create_session
+from store import PlatformStore
+from stubserver import StubServer, make_platforms
+
+
+class TestPlatformStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = StubServer(make_platforms(250)).start()
+        # Like main(), with a response cache whose pages are young enough
+        # to be used without asking.
+        self.cache = ResponseCache(os.path.join(self.directory, 'cache'))
+        self.gb_api = GiantbombAPI('key', session=create_session(retries=0),
+                                   cache=self.cache, revalidate=True)
+        self.gb_api.base_url = self.server.base_url
+        self.store = PlatformStore(os.path.join(self.directory, 'store'))
+
+    def tearDown(self):
+        self.store.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def stored(self, number):
+        return self.store.connection.execute(
+            'SELECT name FROM platforms WHERE id = ?', (number,)).fetchone()
+
+    def test_first_sync_fetches_everything(self):
+        self.assertEqual(self.store.sync(self.gb_api, workers=2), 250)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertNotIn('filter', self.server.requests[0])
+
+    def test_sync_only_asks_for_changes(self):
+        self.store.sync(self.gb_api)
+        del self.server.requests[:]
+        self.store.sync(self.gb_api)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0]['filter'],
+                         'date_last_updated:2015-12-28 00:00:00|'
+                         '9999-12-31 23:59:59')
+
+    def test_sync_sees_platforms_changed_since(self):
+        # The second and third sync send the same query, and the server
+        # confirms that nothing changed in between.
+        for _ in range(3):
+            self.store.sync(self.gb_api)
+        self.assertEqual(self.cache.stats['revalidated'], 1)
+
+        # The "changed since" query is the same as the last one, but its
+        # cached answer is out of date.
+        changed = dict(self.server.platforms[3], name='Renamed',
+                       date_last_updated='2016-01-01 00:00:00')
+        self.server.platforms[3] = changed
+        self.store.sync(self.gb_api)
+        self.assertEqual(self.stored(3)[0], 'Renamed')
+        self.assertEqual(self.store.last_updated(), '2016-01-01 00:00:00')
+
+    def test_platforms_follow_the_query(self):
+        self.store.sync(self.gb_api)
+        platforms = list(self.store.platforms(
+            PlatformQuery(sort='release_date:desc', limit=20)))
+        self.assertEqual(len(platforms), 20)
+        dates = [platform['release_date'] for platform in platforms]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        for platform in platforms:
+            self.assertTrue(platform['original_price'])
+
+        everything = list(self.store.platforms(PlatformQuery()))
+        valid = [platform for platform in make_platforms(250)
+                 if platform['release_date'] and platform['original_price']]
+        self.assertEqual(len(everything), len(valid))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+"""
+A stand-in for the Giantbomb API, for testing the clients in api.py
+without network access or an API key.
+
+StubServer serves GET /api/platforms/ out of a list of platforms, from a
+thread of its own on a free local port. It understands the parameters
+api.py sends (sort, filter, field_list, limit and offset), answers with
+an ETag and with "304 Not Modified" to a matching If-None-Match, and
+remembers the query parameters of every request it got. Any other file
+below /api/ can be served as well, gzip-compressed and in small chunks,
+like a download of the CPI data:
+
+    with StubServer(make_platforms(250)) as server:
+        gb_api = GiantbombAPI('key')
+        gb_api.base_url = server.base_url
+        ...
+        print(len(server.requests))
+"""
+
+import hashlib
+import json
+import threading
+import time
+import zlib
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+
+# Largest number of platforms per page, like the real API.
+PAGE_SIZE = 100
+
+# Size of the chunks files are sent in.
+FILE_CHUNK_SIZE = 16
+
+
+def make_platforms(count):
+    """Returns count made-up platforms. Every fifth of them has no release
+    date and every seventh no price, like some of the real ones."""
+    return [{'id': number,
+             'name': 'Platform {0}'.format(number),
+             'abbreviation': 'P{0}'.format(number),
+             'release_date': ('{0}-{1:02d}-01 00:00:00'.format(
+                 2014 - number % 30, 1 + number % 12)
+                 if number % 5 else None),
+             'original_price': ('{0}.00'.format(100 + number)
+                                if number % 7 else None),
+             'date_last_updated': '2015-{0:02d}-{1:02d} 00:00:00'.format(
+                 1 + number % 12, 1 + number % 28)}
+            for number in range(count)]
+
+
+def _matches(platform, name, value):
+    """Tells whether a platform matches one "name:value" filter; ranges
+    are written "from|to"."""
+    field = platform.get(name)
+    if '|' in value:
+        start, end = value.split('|', 1)
+        return field is not None and start <= field <= end
+    return str(field) == value
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server.stub
+        url = urlparse(self.path)
+        params = dict((name, values[0])
+                      for name, values in parse_qs(url.query).items())
+        with server.lock:
+            server.requests.append(params)
+            platforms = list(server.platforms)
+        if server.latency:
+            time.sleep(server.latency(params) if callable(server.latency)
+                       else server.latency)
+
+        if url.path in server.files:
+            self._send_file(server.files[url.path])
+            return
+        if url.path.rstrip('/') != '/api/platforms':
+            self._send(404, b'')
+            return
+
+        for condition in filter(None, params.get('filter', '').split(',')):
+            name, value = condition.split(':', 1)
+            platforms = [platform for platform in platforms
+                         if _matches(platform, name, value)]
+        if params.get('sort'):
+            name, _, direction = params['sort'].partition(':')
+            # Platforms without a value come first.
+            platforms.sort(key=lambda platform: (
+                platform.get(name) is not None, platform.get(name)),
+                reverse=direction == 'desc')
+
+        offset = int(params.get('offset', 0))
+        limit = min(int(params.get('limit', PAGE_SIZE)), PAGE_SIZE)
+        page = platforms[offset:offset + limit]
+        if params.get('field_list'):
+            names = params['field_list'].split(',')
+            page = [dict((name, platform.get(name)) for name in names)
+                    for platform in page]
+        body = json.dumps({'status_code': 1,
+                           'number_of_total_results': len(platforms),
+                           'number_of_page_results': len(page),
+                           'results': page}).encode('utf-8')
+
+        etag = '"{0}"'.format(hashlib.md5(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, b'', {'ETag': etag})
+        else:
+            self._send(200, body, {'ETag': etag,
+                                   'Content-Type': 'application/json'})
+
+    def _send_file(self, data):
+        """Sends data gzip-compressed, in chunks of FILE_CHUNK_SIZE."""
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(data) + compressor.flush()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for start in range(0, len(body), FILE_CHUNK_SIZE):
+            chunk = body[start:start + FILE_CHUNK_SIZE]
+            self.wfile.write('{0:x}\r\n'.format(len(chunk)).encode('ascii'))
+            self.wfile.write(chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubServer(object):
+    """Serves the given platforms like the Giantbomb API does.
+
+    "latency" is the number of seconds every answer takes, or a function
+    returning it for the query parameters of a request. "files" maps
+    paths such as "/api/cpi.txt" to the bytes served there. "platforms"
+    and "requests" can be changed while the server runs, e.g. to update a
+    platform between two requests.
+
+    """
+
+    def __init__(self, platforms=(), latency=0, files=None):
+        self.platforms = list(platforms)
+        self.latency = latency
+        self.files = dict(files or {})
+        self.requests = []
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """What to set GiantbombAPI.base_url to."""
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}/api'.format(host, port)
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
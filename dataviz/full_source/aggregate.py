@@ -0,0 +1,178 @@
+"""
+Data Visualization Project - Single-pass aggregation
+
+Every visualization used to need its own pass over the data.  The
+Engine below feeds any number of aggregates (counters, group-bys, a
+GeoJSON sink, ...) from one single pass instead.
+
+The data is either an IncidentTable, which every aggregate processes
+with whole-column NumPy operations, or an iterable of row dicts, which
+is handed to the aggregates in batches.
+"""
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from geo import SF_BOUNDS, GridBins
+from incidents import IncidentTable
+
+
+# Number of rows handled at once: handed to the aggregates, or validated
+# as coordinates by dataviz.py.
+BATCH_SIZE = 10000
+
+
+class Aggregate(object):
+    """Base class of everything an Engine can feed.
+
+    `columns` lists the columns the aggregate reads.  Subclasses
+    implement update() for batches of row dicts and update_table() for a
+    whole IncidentTable.
+    """
+
+    columns = ()
+
+    def update(self, lines):
+        raise NotImplementedError
+
+    def update_table(self, table):
+        raise NotImplementedError
+
+    def close(self):
+        """Called once all data has been fed"""
+        pass
+
+    def abort(self):
+        """Called instead of close() if feeding the data failed"""
+        pass
+
+
+class CountBy(Aggregate):
+    """Counts incidents per value of one or more columns.
+
+    With one column, the keys of `counter` are the values of that
+    column; with more columns, they are tuples of values, e.g.
+    CountBy("PdDistrict", "Category") counts ("NORTHERN", "FRAUD").
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.counter = Counter()
+
+    def update(self, lines):
+        if len(self.columns) == 1:
+            name = self.columns[0]
+            self.counter.update(line[name] for line in lines)
+        else:
+            self.counter.update(tuple(line[name] for name in self.columns)
+                                for line in lines)
+
+    def update_table(self, table):
+        if len(self.columns) == 1:
+            self.counter.update(table.counts(self.columns[0]))
+            return
+
+        # Combine the codes of all columns into one code per row, count
+        # those all at once and split them up again.
+        labels = [table.labels[name] for name in self.columns]
+        sizes = [len(names) for names in labels]
+        combined = np.zeros(len(table), dtype=np.int64)
+        for name, size in zip(self.columns, sizes):
+            combined = combined * size + table.columns[name]
+        codes, totals = np.unique(combined, return_counts=True)
+        for code, total in zip(codes.tolist(), totals.tolist()):
+            key = []
+            for names, size in zip(reversed(labels), reversed(sizes)):
+                code, index = divmod(code, size)
+                key.append(names[index])
+            self.counter[tuple(reversed(key))] += total
+
+
+class FeatureSink(Aggregate):
+    """Writes a GeoJSON point feature for every incident into a
+    FeatureCollectionWriter.
+
+    iter_features(data, report=..., start=...) turns row dicts or an
+    IncidentTable into features; `report` ends up with the number of
+    "accepted" and "rejected" rows.
+    """
+
+    columns = ("Category", "Descript", "Date", "X", "Y")
+
+    def __init__(self, writer, iter_features):
+        self.writer = writer
+        self.iter_features = iter_features
+        self.report = Counter()
+        self.rows = 0
+
+    def update(self, lines):
+        self.writer.write_all(self.iter_features(lines, report=self.report,
+                                                 start=self.rows))
+        self.rows += len(lines)
+
+    def update_table(self, table):
+        self.writer.write_all(self.iter_features(table, report=self.report))
+        self.rows += len(table)
+
+    def close(self):
+        self.writer.close()
+
+    def abort(self):
+        self.writer.abort()
+
+
+class ClusterSink(Aggregate):
+    """Bins incidents into a GridBins per zoom level, to be written out as
+    clustered maps.  `grids` holds the GridBins, in the order of the
+    zoom levels."""
+
+    columns = ("Category", "X", "Y")
+
+    def __init__(self, zoom_levels, bounds=SF_BOUNDS):
+        self.grids = [GridBins(zoom) for zoom in zoom_levels]
+        self.bounds = bounds
+
+    def update(self, lines):
+        # GridBins only understands tables, so the batch becomes one.
+        self.update_table(IncidentTable.from_rows(
+            ([line[name] for name in self.columns] for line in lines),
+            list(self.columns), self.columns))
+
+    def update_table(self, table):
+        for grid in self.grids:
+            grid.update(table, self.bounds)
+
+
+class Engine(object):
+    """Feeds all registered aggregates from a single pass over the data"""
+
+    def __init__(self):
+        self.aggregates = []
+
+    def register(self, aggregate):
+        """Adds an aggregate and returns it, to read its results later"""
+        self.aggregates.append(aggregate)
+        return aggregate
+
+    def run(self, data, batch_size=BATCH_SIZE):
+        """Feeds data to every aggregate, then closes them all.  If that
+        fails, they are aborted instead."""
+        try:
+            if isinstance(data, IncidentTable):
+                for aggregate in self.aggregates:
+                    aggregate.update_table(data)
+            else:
+                rows = iter(data)
+                while True:
+                    lines = list(islice(rows, batch_size))
+                    if not lines:
+                        break
+                    for aggregate in self.aggregates:
+                        aggregate.update(lines)
+        except BaseException:
+            for aggregate in self.aggregates:
+                aggregate.abort()
+            raise
+        for aggregate in self.aggregates:
+            aggregate.close()
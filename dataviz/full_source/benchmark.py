@@ -0,0 +1,554 @@
+#!/usr/bin/env python
+
+"""
+Data Visualization Project - Benchmarks
+
+Generates large synthetic incident files out of the sample SFPD export
+and measures how long the dataviz pipeline takes on them, and how much
+memory it needs while doing so.
+
+Every measurement runs in a fresh child process, so the peak resident
+set size (RSS) of one run can't leak into the next one.
+
+The `suite` benchmark times the entry points of dataviz.py on files of
+10^4 up to 10^7 rows and appends the results, tagged with the current
+git commit, to a JSON lines file; `compare` then lines up the results
+of two commits.
+"""
+from __future__ import print_function
+
+from collections import Counter, deque
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+import cache
+import dataviz
+import geojson
+import mmapcsv
+import parallel
+import predicates
+from incidents import DEFAULT_COLUMNS, IncidentTable
+from profiling import peak_rss
+
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, "data", "sample_sfpd_incident_all.csv")
+
+
+# Number of rows generated at once.
+GENERATE_CHUNK = 100000
+
+# Synthetic dates are spread over this many years after the sample's.
+GENERATE_YEARS = 10
+
+# Standard deviation, in degrees, of the noise added to coordinates.
+COORDINATE_NOISE = 0.002
+
+WEEKDAYS = ("Thursday", "Friday", "Saturday", "Sunday", "Monday",
+            "Tuesday", "Wednesday")
+
+
+class ColumnModel(object):
+    """The distributions of the columns of a sample export.
+
+    Columns that belong together are drawn together: the description
+    with its category, and the coordinates with the address.  Dates are
+    the sample's dates moved forward by a random number of years, and
+    the day of week is derived from them.  Any other column is drawn
+    from its own values in the sample.
+    """
+
+    def __init__(self, sample_file=SAMPLE_FILE):
+        with open(sample_file) as sample:
+            csv_data = csv.reader(sample)
+            self.fields = next(csv_data)
+            rows = list(csv_data)
+        index = dict((name, i) for i, name in enumerate(self.fields))
+
+        def values(*names):
+            return [tuple(row[index[name]] for name in names)
+                    for row in rows]
+
+        self.offenses = self._distribution(values("Category", "Descript"))
+        self.places = self._distribution(values("Location", "X", "Y"))
+        self.others = dict(
+            (name, self._distribution(values(name)))
+            for name in self.fields
+            if name not in ("Category", "Descript", "Location", "X", "Y",
+                            "Date", "DayOfWeek", "Time", "IncidntNum"))
+        self.days = np.array(
+            [date[6:10] + "-" + date[0:2] + "-" + date[3:5]
+             for (date,) in values("Date")],
+            dtype="datetime64[D]").astype(np.int64)
+        self.minutes = np.array([int(time[0:2]) * 60 + int(time[3:5])
+                                 for (time,) in values("Time")])
+
+    @staticmethod
+    def _distribution(values):
+        """Returns the distinct values and how likely each of them is"""
+        counts = Counter(values)
+        distinct = list(counts)
+        weights = np.array([counts[value] for value in distinct], dtype=float)
+        return distinct, weights / weights.sum()
+
+    @staticmethod
+    def _draw(distribution, size, rand):
+        """Draws size values out of a distribution"""
+        distinct, weights = distribution
+        return [distinct[i] for i in rand.choice(len(distinct), size,
+                                                 p=weights)]
+
+    def rows(self, size, rand):
+        """Returns size random rows, as lists in the order of fields"""
+        columns = {}
+        offenses = self._draw(self.offenses, size, rand)
+        columns["Category"] = [category for category, _ in offenses]
+        columns["Descript"] = [descript for _, descript in offenses]
+
+        places = self._draw(self.places, size, rand)
+        columns["Location"] = [location for location, _, _ in places]
+        for axis, name in ((1, "X"), (2, "Y")):
+            coordinates = [place[axis] for place in places]
+            noise = rand.normal(0, COORDINATE_NOISE, size)
+            # Keep missing and zero coordinates as they are, since the
+            # map has to deal with those.
+            columns[name] = [
+                value if not value or float(value) == 0
+                else repr(float(value) + delta)
+                for value, delta in zip(coordinates, noise.tolist())]
+
+        days = (self.days[rand.randint(0, len(self.days), size)] +
+                7 * rand.randint(0, 52 * GENERATE_YEARS, size))
+        iso = days.astype("datetime64[D]").astype(str).tolist()
+        columns["Date"] = [date[5:7] + "/" + date[8:10] + "/" + date[0:4]
+                           for date in iso]
+        columns["DayOfWeek"] = [WEEKDAYS[day] for day in (days % 7).tolist()]
+        minutes = (self.minutes[rand.randint(0, len(self.minutes), size)] +
+                   rand.randint(-30, 31, size)) % (24 * 60)
+        columns["Time"] = ["{0:02d}:{1:02d}".format(*divmod(minute, 60))
+                           for minute in minutes.tolist()]
+        columns["IncidntNum"] = ["{0:09d}".format(number) for number in
+                                 rand.randint(0, 10 ** 9, size).tolist()]
+        for name, distribution in self.others.items():
+            columns[name] = [value for (value,) in
+                             self._draw(distribution, size, rand)]
+
+        return zip(*[columns[name] for name in self.fields])
+
+
+def generate(out_file, rows, sample_file=SAMPLE_FILE, seed=0):
+    """Writes a synthetic incident file with the given number of rows.
+
+    The values of every column follow their distribution in the sample
+    file (see ColumnModel), so the file looks like a real SFPD export
+    of any size.
+    """
+    model = ColumnModel(sample_file)
+    rand = np.random.RandomState(seed)
+    with open(out_file, "w") as out:
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(model.fields)
+        for start in range(0, rows, GENERATE_CHUNK):
+            writer.writerows(model.rows(min(GENERATE_CHUNK, rows - start),
+                                        rand))
+
+
+def list_days(raw_file, delimiter):
+    """Counts incidents per day of week the old way, through parse()"""
+    data = dataviz.parse(raw_file, delimiter)
+    return Counter(item["DayOfWeek"] for item in data)
+
+
+def stream_days(raw_file, delimiter):
+    """Counts incidents per day of week in one pass over iter_parse()"""
+    data = dataviz.iter_parse(raw_file, delimiter)
+    return Counter(item["DayOfWeek"] for item in data)
+
+
+def ensure_csvfile(args):
+    """Generates the synthetic file to benchmark unless it exists"""
+    if not os.path.exists(args.csvfile):
+        print("Generating {0} rows into {1}".format(args.rows, args.csvfile))
+        generate(args.csvfile, args.rows)
+
+
+def list_map(raw_file, delimiter):
+    """Writes the map the old way: collecting all features in a list,
+    copying them into one dict and dumping that in one go."""
+    data = dataviz.iter_parse(raw_file, delimiter)
+    item_list = list(dataviz.iter_features(data))
+    geo_map = {"type": "FeatureCollection"}
+    for point in item_list:
+        geo_map.setdefault('features', []).append(point)
+    with open('file_sf.geojson', 'w') as f:
+        f.write(geojson.dumps(geo_map))
+
+
+def stream_map(raw_file, delimiter):
+    """Writes the map feature by feature through create_map()"""
+    dataviz.create_map(dataviz.iter_parse(raw_file, delimiter))
+
+
+def table_map(raw_file, delimiter):
+    """Writes the map from a columnar table, validating all coordinates
+    at once"""
+    dataviz.create_map(cache.load_table(raw_file, delimiter))
+
+
+def filter_after_parse(raw_file, delimiter, where):
+    """Parses every row into a dict first and filters the dicts after,
+    like pre-filtering by hand would"""
+    matches = 0
+    for item in dataviz.iter_parse(raw_file, delimiter):
+        if all(condition.matches(condition.normalize(item[condition.column]))
+               for condition in where):
+            matches += 1
+    return matches
+
+
+def filter_while_parsing(raw_file, delimiter, where):
+    """Drops non-matching rows before building their dicts"""
+    return sum(1 for _ in dataviz.iter_parse(raw_file, delimiter, where))
+
+
+def filter_into_table(raw_file, delimiter, where):
+    """Loads only the matching rows into an IncidentTable"""
+    return len(IncidentTable.from_csv(raw_file, delimiter, where=where))
+
+
+def csv_reader_table(raw_file, delimiter, columns):
+    """Loads columns through csv.reader, which builds every field"""
+    return IncidentTable.from_csv(raw_file, delimiter, columns)
+
+
+def mmap_reader_table(raw_file, delimiter, columns):
+    """Loads columns through the memory-mapped reader, which only cuts
+    out the requested ones"""
+    return mmapcsv.read_table(raw_file, delimiter, columns)
+
+
+def entry_parse(raw_file, delimiter):
+    """parse(): reads every row into a dict.  The rows are streamed
+    through iter_parse() instead of collected in a list, which would
+    need many GiB at 10^7 rows."""
+    deque(dataviz.iter_parse(raw_file, delimiter), maxlen=0)
+
+
+def entry_days(raw_file, delimiter):
+    """visualize_days(), loading its column the way dataviz.py does on a
+    cache miss"""
+    dataviz.visualize_days(mmapcsv.read_table(raw_file, delimiter,
+                                              ["DayOfWeek"]))
+
+
+def entry_type(raw_file, delimiter):
+    """visualize_type(), loading its column like entry_days()"""
+    dataviz.visualize_type(mmapcsv.read_table(raw_file, delimiter,
+                                              ["Category"]))
+
+
+def entry_map(raw_file, delimiter):
+    """create_map(), loading its columns like entry_days()"""
+    dataviz.create_map(mmapcsv.read_table(
+        raw_file, delimiter, ["Category", "Descript", "Date", "X", "Y"]))
+
+
+# Entry points timed by the suite benchmark, in the order they run.
+ENTRY_POINTS = (("parse", entry_parse),
+                ("visualize_days", entry_days),
+                ("visualize_type", entry_type),
+                ("create_map", entry_map))
+
+
+def current_commit():
+    """Returns the git commit the code is at, with "-dirty" appended if
+    there are uncommitted changes, or "unknown" outside of git."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                         cwd=directory).decode().strip()
+        changes = subprocess.check_output(["git", "status", "--porcelain",
+                                           "--untracked-files=no"],
+                                          cwd=directory).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + "-dirty" if changes else commit
+
+
+def _measure(func, args):
+    """Runs func(*args) and returns (wall time, peak RSS).  Meant to be
+    called inside a throwaway child process."""
+    start = time.time()
+    func(*args)
+    return time.time() - start, peak_rss()
+
+
+def measure(func, *args):
+    """Runs func(*args) in a fresh process and returns its wall time in
+    seconds and its peak RSS in MiB."""
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(_measure, (func, args))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def bench_parse(args):
+    """Compares the list-based parse() with the streaming iter_parse()"""
+    ensure_csvfile(args)
+
+    baseline = measure(time.sleep, 0)
+    print("{0:<12} {1:>10} {2:>14}".format("mode", "wall (s)",
+                                           "peak RSS (MiB)"))
+    print("{0:<12} {1:>10.2f} {2:>14.1f}".format("baseline", *baseline))
+    for name, func in (("list", list_days), ("stream", stream_days)):
+        wall, peak = measure(func, args.csvfile, args.delimiter)
+        print("{0:<12} {1:>10.2f} {2:>14.1f}".format(name, wall, peak))
+
+
+def bench_map(args):
+    """Compares writing the map in one go with streaming it, and with
+    writing it from a (cached) columnar table"""
+    ensure_csvfile(args)
+
+    baseline = measure(time.sleep, 0)
+    print("{0:<12} {1:>10} {2:>14}".format("mode", "wall (s)",
+                                           "peak RSS (MiB)"))
+    print("{0:<12} {1:>10.2f} {2:>14.1f}".format("baseline", *baseline))
+    cache.load_table(args.csvfile, args.delimiter)
+    for name, func in (("list", list_map), ("stream", stream_map),
+                       ("table", table_map)):
+        wall, peak = measure(func, args.csvfile, args.delimiter)
+        print("{0:<12} {1:>10.2f} {2:>14.1f}".format(name, wall, peak))
+
+
+def bench_where(args):
+    """Compares filtering after parsing with filtering while parsing"""
+    ensure_csvfile(args)
+
+    where = [predicates.parse_where(expression) for expression in args.where]
+    print("{0:<12} {1:>10} {2:>10}".format("mode", "wall (s)", "rows"))
+    for name, func in (("after", filter_after_parse),
+                       ("pushdown", filter_while_parsing),
+                       ("table", filter_into_table)):
+        start = time.time()
+        rows = func(args.csvfile, args.delimiter, where)
+        wall = time.time() - start
+        print("{0:<12} {1:>10.2f} {2:>10}".format(name, wall, rows))
+
+
+def bench_workers(args):
+    """Measures how parallel_count scales with the number of workers"""
+    ensure_csvfile(args)
+
+    # The pool of workers can't be started from within another pool, so
+    # unlike the other benchmarks this one runs in the current process.
+    print("{0:<12} {1:>10} {2:>10}".format("workers", "wall (s)", "speedup"))
+    single = None
+    for workers in args.workers:
+        start = time.time()
+        parallel.parallel_count(args.csvfile, args.delimiter, "Category",
+                                workers)
+        wall = time.time() - start
+        single = single or wall
+        print("{0:<12} {1:>10.2f} {2:>10.2f}".format(workers, wall,
+                                                      single / wall))
+
+
+def bench_reader(args):
+    """Compares csv.reader with the memory-mapped reader, for a single
+    column and for everything the visualizations need"""
+    ensure_csvfile(args)
+
+    print("{0:<12} {1:<8} {2:>10} {3:>14}".format("reader", "columns",
+                                                   "wall (s)",
+                                                   "peak RSS (MiB)"))
+    for columns in (["DayOfWeek"], list(DEFAULT_COLUMNS)):
+        for name, func in (("csv", csv_reader_table),
+                           ("mmap", mmap_reader_table)):
+            wall, peak = measure(func, args.csvfile, args.delimiter, columns)
+            print("{0:<12} {1:<8} {2:>10.2f} {3:>14.1f}".format(
+                name, len(columns), wall, peak))
+
+
+def bench_suite(args):
+    """Times every entry point on synthetic files of the given sizes and
+    appends the results to the results file"""
+    commit = current_commit()
+    results_file = os.path.abspath(args.results)
+    data_dir = os.path.abspath(args.data_dir)
+    # The graphs and maps written by the entry points go to a scratch
+    # directory, which the child processes inherit as their own.
+    out_dir = tempfile.mkdtemp(prefix="dataviz-bench-")
+    cwd = os.getcwd()
+
+    print("{0:<10} {1:<16} {2:>10} {3:>14} {4:>12}".format(
+        "rows", "entry point", "wall (s)", "peak RSS (MiB)", "rows/s"))
+    os.chdir(out_dir)
+    try:
+        for rows in args.sizes:
+            raw_file = os.path.join(data_dir,
+                                    "synthetic_sfpd_{0}.csv".format(rows))
+            if not os.path.exists(raw_file):
+                print("Generating {0} rows into {1}".format(rows, raw_file))
+                generate(raw_file, rows)
+            for name, func in ENTRY_POINTS:
+                if args.entry and name not in args.entry:
+                    continue
+                wall, peak = measure(func, raw_file, args.delimiter)
+                print("{0:<10} {1:<16} {2:>10.2f} {3:>14.1f} {4:>12.0f}"
+                      .format(rows, name, wall, peak, rows / wall))
+                with open(results_file, "a") as results:
+                    results.write(json.dumps(
+                        {"commit": commit,
+                         "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                         "python": platform.python_version(),
+                         "entry": name,
+                         "rows": rows,
+                         "wall_seconds": round(wall, 4),
+                         "peak_rss_mib": round(peak, 1)},
+                        sort_keys=True) + "\n")
+    finally:
+        os.chdir(cwd)
+
+
+def load_results(results_file, commit):
+    """Returns the latest wall time of every (rows, entry point) measured
+    at a commit, which may be given as a prefix"""
+    walls = {}
+    with open(results_file) as results:
+        for line in results:
+            result = json.loads(line)
+            if result["commit"].startswith(commit):
+                walls[result["rows"], result["entry"]] = \
+                    result["wall_seconds"]
+    return walls
+
+
+def bench_compare(args):
+    """Lines up the suite results of two commits"""
+    base = load_results(args.results, args.base)
+    head = load_results(args.results, args.head or current_commit())
+    print("{0:<10} {1:<16} {2:>10} {3:>10} {4:>8}".format(
+        "rows", "entry point", "base (s)", "head (s)", "ratio"))
+    for key in sorted(set(base) & set(head)):
+        print("{0:<10} {1:<16} {2:>10.2f} {3:>10.2f} {4:>8.2f}".format(
+            key[0], key[1], base[key], head[key], head[key] / base[key]))
+
+
+def bench_generate(args):
+    """Writes a synthetic file, replacing any existing one"""
+    generate(args.csvfile, args.rows, seed=args.seed)
+
+
+def bench_cache(args):
+    """Compares loading a table with a cold and a warm binary cache"""
+    ensure_csvfile(args)
+
+    cache_file = cache.cache_file(args.csvfile)
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    print("{0:<12} {1:>10} {2:>8} {3:>8}".format("run", "wall (s)", "hits",
+                                                 "misses"))
+    for run in ("cold", "warm", "warm"):
+        start = time.time()
+        cache.load_table(args.csvfile, args.delimiter)
+        wall = time.time() - start
+        print("{0:<12} {1:>10.3f} {2:>8} {3:>8}".format(
+            run, wall, cache.stats["hits"], cache.stats["misses"]))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--csvfile',
+                            help="Synthetic CSV file to benchmark against.\
+                            It is generated first if it doesn't exist.",
+                            type=str, default="synthetic_sfpd.csv")
+    arg_parser.add_argument('--rows',
+                            help="Number of rows of the synthetic file",
+                            type=int, default=10 * 1000 * 1000)
+    arg_parser.add_argument('--delimiter',
+                            help="Delimiter of the Input File",
+                            type=str, default=",")
+    subparsers = arg_parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+    subparsers.add_parser('parse', help="list vs. streaming parse").\
+        set_defaults(func=bench_parse)
+    subparsers.add_parser('map', help="one-shot vs. streaming GeoJSON").\
+        set_defaults(func=bench_map)
+    workers_parser = subparsers.add_parser('workers',
+                                           help="parallel parse scaling")
+    workers_parser.add_argument('--workers',
+                                help="Worker counts to measure",
+                                type=int, nargs="+", default=[1, 2, 4, 8])
+    workers_parser.set_defaults(func=bench_workers)
+    subparsers.add_parser('cache', help="cold vs. warm binary cache").\
+        set_defaults(func=bench_cache)
+    subparsers.add_parser('reader', help="csv.reader vs. memory map").\
+        set_defaults(func=bench_reader)
+    where_parser = subparsers.add_parser('where',
+                                         help="filtering after vs. while\
+                                         parsing")
+    where_parser.add_argument('--where',
+                              help="Filter to apply; can be given more than\
+                              once",
+                              type=str, action='append',
+                              default=[], metavar='FILTER')
+    where_parser.set_defaults(func=bench_where)
+    generate_parser = subparsers.add_parser('generate',
+                                            help="write a synthetic file\
+                                            of --rows rows into\
+                                            --csvfile")
+    generate_parser.add_argument('--seed',
+                                 help="Seed of the random generator",
+                                 type=int, default=0)
+    generate_parser.set_defaults(func=bench_generate)
+    suite_parser = subparsers.add_parser('suite',
+                                         help="time the entry points at\
+                                         several file sizes")
+    suite_parser.add_argument('--sizes',
+                              help="Numbers of rows to measure",
+                              type=int, nargs="+",
+                              default=[10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7])
+    suite_parser.add_argument('--entry',
+                              help="Only time these entry points",
+                              choices=[name for name, _ in ENTRY_POINTS],
+                              nargs="+")
+    suite_parser.add_argument('--data-dir',
+                              help="Directory of the synthetic files",
+                              type=str, default=".")
+    suite_parser.add_argument('--results',
+                              help="JSON lines file the results are\
+                              appended to",
+                              type=str, default="benchmark_results.jsonl")
+    suite_parser.set_defaults(func=bench_suite)
+    compare_parser = subparsers.add_parser('compare',
+                                           help="compare the suite results\
+                                           of two commits")
+    compare_parser.add_argument('base', help="Commit (or its prefix) to\
+                                compare against")
+    compare_parser.add_argument('head', nargs="?",
+                                help="Commit to compare; defaults to the\
+                                current one")
+    compare_parser.add_argument('--results',
+                                help="JSON lines file of the results",
+                                type=str, default="benchmark_results.jsonl")
+    compare_parser.set_defaults(func=bench_compare)
+
+    args = arg_parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Data Visualization Project - On-disk cache of parsed incident files
+
+Parsing a large CSV file takes a while, and we tend to parse the same
+file over and over again.  The first time a file is loaded, its columns
+are written as an IncidentTable into a binary .npz file right next to
+it.  Later runs load that file instead, as long as the CSV file still
+has the same path, size and modification time and is read with the
+same delimiter.
+"""
+from collections import Counter
+
+import json
+import os
+
+from incidents import DEFAULT_COLUMNS, IncidentTable
+from mmapcsv import read_table
+
+
+# Appended to the name of the CSV file to get the name of its cache.
+CACHE_SUFFIX = ".cache.npz"
+
+# Number of cache hits and misses in this process.
+stats = Counter()
+
+
+def cache_file(raw_file):
+    """Returns the path of the cache belonging to raw_file"""
+    return raw_file + CACHE_SUFFIX
+
+
+def cache_key(raw_file, delimiter):
+    """Describes the state of raw_file; the cache is only valid while this
+    stays the same."""
+    info = os.stat(raw_file)
+    return json.dumps({"path": os.path.abspath(raw_file),
+                       "size": info.st_size,
+                       "mtime": info.st_mtime,
+                       "delimiter": delimiter}, sort_keys=True)
+
+
+def _read_cache(raw_file, key):
+    """Returns the cached table of raw_file, or None if there is no
+    cache matching key."""
+    try:
+        table, meta = IncidentTable.load(cache_file(raw_file))
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+    if meta.get("key") != key:
+        return None
+    return table
+
+
+def _write_cache(raw_file, table, key):
+    """Stores table as the cache of raw_file.  A cache that can't be
+    written (e.g. in a read-only directory) is silently skipped."""
+    path = cache_file(raw_file)
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as out:
+            table.save(out, key=key)
+        os.rename(temp_path, path)
+    except (IOError, OSError):
+        pass
+
+
+def load_table(raw_file, delimiter, columns=DEFAULT_COLUMNS):
+    """Loads the given columns of raw_file, going through the cache.
+
+    On a miss the file is read through a memory map, and the columns
+    that were already cached are read along with the requested ones, so
+    that the cache keeps growing towards everything that has ever been
+    asked for.
+    """
+    key = cache_key(raw_file, delimiter)
+    cached = _read_cache(raw_file, key)
+    if cached is not None and set(columns) <= set(cached.columns):
+        stats["hits"] += 1
+        return cached
+
+    stats["misses"] += 1
+    wanted = list(columns)
+    if cached is not None:
+        wanted.extend(name for name in cached.columns if name not in wanted)
+    table = read_table(raw_file, delimiter, columns=wanted)
+    _write_cache(raw_file, table, key)
+    return table
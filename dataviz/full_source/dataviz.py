@@ -6,113 +6,173 @@ Data Visualization Project
 Parse data from an ugly CSV or Excel file, and render it in
 JSON-like form, visualize in graphs, and plot on Google Maps.
 """
+from __future__ import print_function
+
 from collections import Counter
+from functools import partial
+from itertools import islice
 
 import argparse
 import csv
-import geojson
-import matplotlib.pyplot as plt
-import numpy as np
+import re
 
+import numpy as np
 
-def parse(raw_file, delimiter):
-    """Parses a raw CSV file to a JSON-like object"""
+from aggregate import BATCH_SIZE, ClusterSink, CountBy, Engine, FeatureSink
+from cache import load_table
+from geo import (SF_BOUNDS, FeatureCollectionWriter, GridBins,
+                 parse_coordinates, valid_coordinates)
+from incidents import IncidentTable
+from incremental import ingest
+from parallel import parallel_count, parallel_features
+from predicates import compile_conditions, parse_where, table_mask
+from profiling import enable as enable_profiling, profiled, stage
+from render import default_renderer, render_batch
+from timeseries import FREQUENCIES, TimeIndex, to_seconds, years
+
+
+def iter_parse(raw_file, delimiter, where=None):
+    """Parses a raw CSV file lazily, yielding one JSON-like dict per row.
+
+    Only the current row is held in memory, so the visualizations below
+    can consume exports of any size in a single pass.  With a list of
+    predicates.Condition as where, only rows matching all of them are
+    yielded.
+    """
 
     # Open CSV file, and safely close it when we're done
-    opened_file = open(raw_file)
+    with open(raw_file) as opened_file:
+
+        # Read the CSV data
+        csv_data = csv.reader(opened_file, delimiter=delimiter)
+
+        # Skip over the first line of the file for the headers
+        fields = next(csv_data)
+
+        # Compile the filter once; rows it rejects are dropped before we
+        # spend any time building a dict for them.
+        keep = compile_conditions(where, fields)
 
-    # Read the CSV data
-    csv_data = csv.reader(opened_file, delimiter=delimiter)
+        # Iterate over each row of the csv file, zip together field -> value
+        # and hand it out right away instead of collecting it in a list.
+        for row in csv_data:
+            if keep is None or keep(row):
+                yield dict(zip(fields, row))
 
-    # Setup an empty list
-    parsed_data = []
 
-    # Skip over the first line of the file for the headers
-    fields = csv_data.next()
+@profiled("parse")
+def parse(raw_file, delimiter):
+    """Parses a raw CSV file to a JSON-like object"""
 
-    # Iterate over each row of the csv file, zip together field -> value
-    for row in csv_data:
-        parsed_data.append(dict(zip(fields, row)))
+    # Collect every row yielded by iter_parse into one list.  Handy for
+    # poking at small files; large ones should stick to iter_parse.
+    return list(iter_parse(raw_file, delimiter))
 
-    # Close the CSV file
-    opened_file.close()
 
-    return parsed_data
+def count(data_file, column):
+    """Counts the incidents per value of the given column.
 
+    data_file can either be an IncidentTable, which counts with a single
+    np.bincount call, or any iterable of row dicts.
+    """
+    if isinstance(data_file, IncidentTable):
+        return data_file.counts(column)
+    return Counter(item[column] for item in data_file)
 
+
+@profiled("visualize_days")
 def visualize_days(data_file):
     """Visualize data by day of week"""
 
     # Returns a dict where it sums the total values for each key.
     # In this case, the keys are the DaysOfWeek, and the values are
     # a count of incidents.
-    counter = Counter(item["DayOfWeek"] for item in data_file)
-
-    # Separate out the counter to order it correctly when plotting.
-    data_list = [counter["Monday"],
-                 counter["Tuesday"],
-                 counter["Wednesday"],
-                 counter["Thursday"],
-                 counter["Friday"],
-                 counter["Saturday"],
-                 counter["Sunday"]
-                 ]
-    day_tuple = tuple(["Mon", "Tues", "Wed", "Thurs", "Fri", "Sat", "Sun"])
+    plot_days(count(data_file, "DayOfWeek"))
 
-    # Assign the data to a plot
-    plt.plot(data_list)
 
-    # Assign labels to the plot
-    plt.xticks(range(len(day_tuple)), day_tuple)
+@profiled("render")
+def plot_days(counter, out_file="Days.png"):
+    """Plots incident counts per day of week into Days.png"""
 
     # Save the graph!
     # If you look at new-coder/dataviz/tutorial_source, you should see
     # the PNG file, "Days.png".  This is our graph!
-    plt.savefig("Days.png")
-
-    # Close figure
-    plt.clf()
+    default_renderer().days(counter, out_file)
 
 
+@profiled("visualize_type")
 def visualize_type(data_file):
     """Visualize data by category in a bar graph"""
 
     # Same as before, this returns a dict where it sums the total
     # incidents per Category.
-    counter = Counter(item["Category"] for item in data_file)
+    plot_type(count(data_file, "Category"))
 
-    # Set the labels which are based on the keys of our counter.
-    labels = tuple(counter.keys())
 
-    # Set where the labels hit the x-axis
-    xlocations = np.arange(len(labels)) + 0.5
+@profiled("render")
+def plot_type(counter, out_file="Type.png"):
+    """Plots incident counts per category as bar graph into Type.png"""
 
-    # Width of each bar
-    width = 0.5
+    # Save the graph!
+    # If you look at new-coder/dataviz/tutorial_source, you should see
+    # the PNG file, "Type.png".  This is our graph!
+    default_renderer().types(counter, out_file)
 
-    # Assign data to a bar plot
-    plt.bar(xlocations, counter.values(), width=width)
 
-    # Assign labels and tick location to x- and y-axis
-    plt.xticks(xlocations + width / 2, labels, rotation=90)
-    plt.yticks(range(0, max(counter.values()), 5))
+@profiled("visualize_split")
+def visualize_split(data_file, chart, split_by, workers=1):
+    """Draws one Days or Type graph per district, category, ... or year.
 
-    # Give some more room so the labels aren't cut off in the graph
-    plt.subplots_adjust(bottom=0.4)
+    data_file has to be an IncidentTable.  split_by is either the name of
+    one of its columns or "year", which needs the Date column.  The
+    graphs go to files like Days_NORTHERN.png and are rendered in a pool
+    of processes if workers > 1.
+    """
+    if split_by == "year":
+        labels, groups = years(data_file)
+    else:
+        labels = data_file.labels[split_by]
+        groups = data_file.columns[split_by]
+
+    # Count all groups at once, then hand out one chart per group.
+    column = "DayOfWeek" if chart == "Days" else "Category"
+    method = "days" if chart == "Days" else "types"
+    counters = data_file.grouped_counts(groups, len(labels), column)
+    jobs = []
+    for label, counter in zip(labels, counters):
+        name = re.sub(r"\W+", "_", label) or "unknown"
+        out_file = "{0}_{1}.png".format(chart, name)
+        jobs.append((method, (counter, out_file, label or "unknown")))
+    render_batch(jobs, workers)
+
+
+@profiled("visualize_time")
+def visualize_time(data_file, frequency="month", start=None, end=None):
+    """Visualize the number of incidents over time.
+
+    data_file has to be an IncidentTable with the Date and Time columns.
+    Incidents are counted per hour, day, week or month, optionally only
+    from start (inclusive) to end (exclusive), given as "YYYY-MM-DD".
+    """
 
-    # Make the overall graph/figure larger
-    plt.rcParams['figure.figsize'] = 12, 8
+    # Sort the incidents by time once; the date range then becomes two
+    # binary searches into the sorted times.
+    index = TimeIndex.from_table(data_file)
+    buckets, counts = index.counts(
+        frequency,
+        None if start is None else to_seconds(start),
+        None if end is None else to_seconds(end))
+    plot_time(buckets, counts, frequency)
 
-    # Save the graph!
-    # If you look at new-coder/dataviz/tutorial_source, you should see
-    # the PNG file, "Type.png".  This is our graph!
-    plt.savefig("Type.png")
 
-    # Close figure
-    plt.clf()
+@profiled("render")
+def plot_time(buckets, counts, frequency, out_file="Time.png"):
+    """Plots incident counts per time bucket into Time.png"""
+    default_renderer().time(buckets, counts, frequency, out_file)
 
 
-def create_map(data_file):
+@profiled("create_map")
+def create_map(data_file, compress=False, bounds=SF_BOUNDS):
     """Creates a GeoJSON file.
 
     Returns a GeoJSON file that can be rendered in a GitHub
@@ -120,50 +180,232 @@ def create_map(data_file):
     paste into a new Gist, then create either a public or
     private gist.  GitHub will automatically render the GeoJSON
     file as a map.
-    """
-
-    # Define type of GeoJSON we're creating
-    geo_map = {"type": "FeatureCollection"}
-
-    # Define empty list to collect each point to graph
-    item_list = []
 
-    # Iterate over our data to create GeoJSOn document.
-    # We're using enumerate() so we get the line, as well
-    # the index, which is the line number.
-    for index, line in enumerate(data_file):
-
-        # Skip any zero coordinates as this will throw off
-        # our map.
-        if line['X'] == "0" or line['Y'] == "0":
-            continue
-
-        # Setup a new dictionary for each iteration.
-        data = {}
+    With compress=True the file is gzip-compressed.  Only incidents
+    within bounds end up on the map; the returned Counter tells how many
+    rows were mapped ("accepted") and how many were "rejected".
+    """
 
-        # Assigne line items to appropriate GeoJSON fields.
-        data['type'] = 'Feature'
-        data['id'] = index
-        data['properties'] = {'title': line['Category'],
-                              'description': line['Descript'],
-                              'date': line['Date']}
-        data['geometry'] = {'type': 'Point',
-                            'coordinates': (line['X'], line['Y'])}
+    # Turn every row into a point and stream it straight into the file.
+    report = Counter()
+    save_map(iter_features(data_file, bounds, report), compress)
+    return report
 
-        # Add data dictionary to our item_list
-        item_list.append(data)
 
-    # For each point in our item_list, we add the point to our
-    # dictionary.  setdefault creates a key called 'features' that
-    # has a value type of an empty list.  With each iteration, we
-    # are appending our point to that list.
-    for point in item_list:
-        geo_map.setdefault('features', []).append(point)
+def iter_features(data_file, bounds=SF_BOUNDS, report=None, start=0):
+    """Yields a GeoJSON point feature for every row with coordinates
+    within bounds.
 
-    # Now that all data is parsed in GeoJSON write to a file so we
-    # can upload it to gist.github.com
-    with open('file_sf.geojson', 'w') as f:
-        f.write(geojson.dumps(geo_map))
+    data_file is either an IncidentTable or an iterable of row dicts.
+    Rows are validated in batches: their coordinates are converted to
+    float arrays and checked against the bounds all at once.  If given,
+    report counts the "accepted" and "rejected" rows.  Row dicts are
+    numbered from start onwards.
+    """
+    if report is None:
+        report = Counter()
+
+    if isinstance(data_file, IncidentTable):
+        x = data_file.columns['X']
+        y = data_file.columns['Y']
+        indexes = np.flatnonzero(valid_coordinates(x, y, bounds))
+        report['accepted'] += len(indexes)
+        report['rejected'] += len(data_file) - len(indexes)
+        for index, line in zip(indexes, data_file.iter_rows(indexes)):
+            yield make_feature(int(index), line, x[index], y[index])
+        return
+
+    # Iterate over our data to create GeoJSOn document, one batch of
+    # lines at a time.  We keep track of the index of the first line in
+    # each batch, so we know the line number of every line.
+    rows = iter(data_file)
+    while True:
+        lines = list(islice(rows, BATCH_SIZE))
+        if not lines:
+            break
+        x = parse_coordinates([line['X'] for line in lines])
+        y = parse_coordinates([line['Y'] for line in lines])
+        indexes = np.flatnonzero(valid_coordinates(x, y, bounds))
+        report['accepted'] += len(indexes)
+        report['rejected'] += len(lines) - len(indexes)
+        for index in indexes:
+            yield make_feature(start + int(index), lines[index],
+                               x[index], y[index])
+        start += len(lines)
+
+
+def make_feature(index, line, x, y):
+    """Turns one parsed row and its coordinates into a GeoJSON point
+    feature."""
+
+    # Setup a new dictionary for each iteration.
+    data = {}
+
+    # Assigne line items to appropriate GeoJSON fields.
+    data['type'] = 'Feature'
+    data['id'] = index
+    data['properties'] = {'title': line['Category'],
+                          'description': line['Descript'],
+                          'date': line['Date']}
+    data['geometry'] = {'type': 'Point',
+                        'coordinates': (float(x), float(y))}
+    return data
+
+
+def map_writer(compress=False):
+    """Opens file_sf.geojson (or, compressed, file_sf.geojson.gz) for
+    writing features into it"""
+    out_file = 'file_sf.geojson.gz' if compress else 'file_sf.geojson'
+    return FeatureCollectionWriter(out_file, compress)
+
+
+def save_map(features, compress=False):
+    """Writes GeoJSON features to file_sf.geojson (or, compressed, to
+    file_sf.geojson.gz) as they come in."""
+
+    # Each feature is written out as soon as we get it, so the map never
+    # has to fit into memory as a whole.  Once all of them are written,
+    # the file can be uploaded to gist.github.com
+    with map_writer(compress) as writer:
+        writer.write_all(features)
+
+
+@profiled("create_cluster_map")
+def create_cluster_map(table, zoom_levels, compress=False, bounds=SF_BOUNDS):
+    """Creates one clustered GeoJSON file per zoom level.
+
+    Instead of a point per incident, every file holds a point per cell of
+    a grid, with the number of incidents in that cell and how they break
+    down by category.  The files are named file_sf_z<zoom>.geojson.
+    """
+    grids = []
+    for zoom in zoom_levels:
+        grid = GridBins(zoom)
+        grid.update(table, bounds)
+        grids.append(grid)
+    save_clusters(grids, compress)
+
+
+def save_clusters(grids, compress=False):
+    """Writes every GridBins into its own file_sf_z<zoom>.geojson (or
+    .geojson.gz when compressed)"""
+    for grid in grids:
+        out_file = 'file_sf_z{0}.geojson'.format(grid.zoom)
+        if compress:
+            out_file += '.gz'
+        with FeatureCollectionWriter(out_file, compress) as writer:
+            writer.write_all(grid.features())
+
+
+@profiled("visualize_all")
+def visualize_all(data_file, group_bys=(), compress=False, bounds=SF_BOUNDS,
+                  zoom_levels=None):
+    """Creates the Days and Type graphs and the map in one single pass
+    over the data.
+
+    Every tuple of column names in group_bys is counted along the way and
+    saved by save_groups().  With zoom_levels, the map is clustered like
+    create_cluster_map() does it.  Returns the report of the map, like
+    create_map() does, or None for a clustered map.
+    """
+    engine = Engine()
+    days = engine.register(CountBy("DayOfWeek"))
+    types = engine.register(CountBy("Category"))
+    if zoom_levels:
+        points = engine.register(ClusterSink(zoom_levels, bounds))
+    else:
+        points = engine.register(FeatureSink(map_writer(compress),
+                                             partial(iter_features,
+                                                     bounds=bounds)))
+    groups = [engine.register(CountBy(*columns)) for columns in group_bys]
+
+    engine.run(data_file)
+
+    plot_days(days.counter)
+    plot_type(types.counter)
+    for group in groups:
+        save_groups(group.columns, group.counter)
+    if zoom_levels:
+        save_clusters(points.grids, compress)
+        return None
+    return points.report
+
+
+def save_groups(columns, counter):
+    """Writes the counts of a group-by, largest first, to a CSV file
+    named after its columns, e.g. groups_PdDistrict_Category.csv"""
+    out_file = 'groups_{0}.csv'.format('_'.join(columns))
+    with open(out_file, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(list(columns) + ['Count'])
+        for key, total in counter.most_common():
+            # A single column is counted by its plain values, not tuples
+            if len(columns) == 1:
+                key = (key,)
+            writer.writerow(list(key) + [total])
+
+
+@profiled("visualize_incremental")
+def visualize_incremental(args):
+    """Updates the aggregates kept in the --incremental state file with
+    the rows appended to the CSV file since the last run, then draws the
+    requested graphs and maps from them."""
+    state = ingest(args['csvfile'], args['delimiter'], args['incremental'],
+                   args['cluster'] or (), args['where'], args['bbox'])
+    if args['type'] in ('Days', 'all'):
+        plot_days(state.days)
+    if args['type'] in ('Type', 'all'):
+        plot_type(state.categories)
+    if args['type'] in ('Map', 'all'):
+        save_clusters(state.grids.values(), args['gzip'])
+
+
+def print_report(report):
+    """Prints how many rows create_map put on the map"""
+    print("Mapped {0} incidents, skipped {1} rows without valid "
+          "coordinates".format(report['accepted'], report['rejected']))
+
+
+@profiled("parse")
+def load_data(args, columns):
+    """Loads the given columns of the CSV file named on the command line,
+    plus those needed by its --where filters, and applies the filters.
+
+    The table comes from the binary cache next to the CSV file, parsing
+    the file only if needed, and is filtered afterwards.  With
+    --no-cache, the filters are applied while parsing instead.
+    """
+    where = args['where']
+    columns = list(columns)
+    columns.extend(condition.column for condition in where
+                   if condition.column not in columns)
+    if args['no_cache']:
+        return IncidentTable.from_csv(args['csvfile'], args['delimiter'],
+                                      columns, where)
+    table = load_table(args['csvfile'], args['delimiter'], columns)
+    if where:
+        table = table.take(table_mask(where, table))
+    return table
+
+
+def read_header(raw_file, delimiter):
+    """Returns the column names in the first line of a CSV file"""
+    with open(raw_file) as opened_file:
+        return next(csv.reader(opened_file, delimiter=delimiter), [])
+
+
+def iso_date(value):
+    """argparse type for --since and --until: checks that value is a
+    valid "YYYY-MM-DD" date and returns it unchanged"""
+    if not re.match(r"^\d{4}-\d{2}-\d{2}$", value):
+        raise argparse.ArgumentTypeError(
+            "{0!r} is not a date like 2003-01-31".format(value))
+    try:
+        to_seconds(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "{0!r} is not a valid date".format(value))
+    return value
 
 
 def main():
@@ -177,22 +419,182 @@ def main():
                             type=str, default=",")
     arg_parser.add_argument('--type',
                             help="Visualize data over days of the week,\
-                            type frequency,\ or Google Maps",
-                            choices=["Days", "Type", "Map"],
+                            type frequency, time,\ or Google Maps, or the\
+                            days, types and map at once",
+                            choices=["Days", "Type", "Time", "Map", "all"],
                             type=str, required=True)
+    arg_parser.add_argument('--workers',
+                            help="Number of processes parsing the file in\
+                            parallel",
+                            type=int, default=1)
+    arg_parser.add_argument('--frequency',
+                            help="Bucket size of the Time graph",
+                            choices=sorted(FREQUENCIES), default="month")
+    arg_parser.add_argument('--since',
+                            help="Only graph incidents from this date on\
+                            (YYYY-MM-DD)",
+                            type=iso_date)
+    arg_parser.add_argument('--until',
+                            help="Only graph incidents before this date\
+                            (YYYY-MM-DD)",
+                            type=iso_date)
+    arg_parser.add_argument('--split-by',
+                            help="Draw one Days or Type graph per value of\
+                            this column (e.g. PdDistrict), or per year",
+                            type=str, metavar='COLUMN')
+    arg_parser.add_argument('--gzip',
+                            help="Write the map as gzip-compressed GeoJSON",
+                            action='store_true')
+    arg_parser.add_argument('--bbox',
+                            help="Only map incidents within this bounding\
+                            box",
+                            type=float, nargs=4, default=SF_BOUNDS,
+                            metavar=('MIN_X', 'MIN_Y', 'MAX_X', 'MAX_Y'))
+    arg_parser.add_argument('--cluster',
+                            help="Cluster the map into a grid for each of\
+                            the given zoom levels instead of plotting\
+                            every incident",
+                            type=int, nargs='+', metavar='ZOOM')
+    arg_parser.add_argument('--group-by',
+                            help="With --type all, also count incidents\
+                            per combination of the given columns.  Can be\
+                            given more than once.",
+                            type=str, nargs='+', action='append',
+                            default=[], metavar='COLUMN')
+    arg_parser.add_argument('--where',
+                            help="Only look at incidents matching this\
+                            filter, e.g. 'PdDistrict=NORTHERN',\
+                            'Category in (FRAUD,ASSAULT)' or\
+                            'Date>=2003-01-01'.  Can be given more than\
+                            once; all filters have to match.",
+                            type=parse_where, action='append', default=[],
+                            metavar='FILTER')
+    arg_parser.add_argument('--incremental',
+                            help="Keep the Days, Type and (clustered) Map\
+                            aggregates in this state file, and only parse\
+                            rows appended to the CSV file since the last\
+                            run",
+                            type=str, metavar='STATE_FILE')
+    arg_parser.add_argument('--no-cache',
+                            help="Always parse the CSV file instead of\
+                            loading it from its binary cache",
+                            action='store_true')
+    arg_parser.add_argument('--profile',
+                            help="Write the wall time, CPU time, peak\
+                            memory and rows per second of every stage of\
+                            the run into this JSON file",
+                            type=str, metavar='REPORT_FILE')
     # Returns a dictionary of keys = argument flag, and value = argument
     args = vars(arg_parser.parse_args())
 
-    # Parse data
-    data = parse(args['csvfile'], args['delimiter'])
-
-    # Call appropriate visualization function
-    if args['type'] == 'Days':
-        visualize_days(data)
+    if args['incremental']:
+        if args['type'] == 'Time':
+            arg_parser.error("--incremental doesn't support --type Time")
+        if args['type'] in ('Map', 'all') and not args['cluster']:
+            arg_parser.error("--incremental maps need --cluster")
+        for option in ('group_by', 'split_by'):
+            if args[option]:
+                arg_parser.error("--incremental doesn't support --{0}"
+                                 .format(option.replace('_', '-')))
+        if args['workers'] > 1:
+            arg_parser.error("--incremental doesn't support --workers")
+
+    # Column names are checked against the header of the file up front,
+    # instead of failing somewhere in the middle of parsing it.
+    try:
+        fields = read_header(args['csvfile'], args['delimiter'])
+    except (IOError, OSError) as error:
+        arg_parser.error("can't read --csvfile: {0}".format(error))
+    unknown = [condition.column for condition in args['where']
+               if condition.column not in fields]
+    if unknown:
+        arg_parser.error("--where on unknown column(s): {0}".format(
+            ", ".join(unknown)))
+    if args['group_by']:
+        if args['type'] != 'all':
+            arg_parser.error("--group-by needs --type all")
+        unknown = [name for group_by in args['group_by']
+                   for name in group_by if name not in fields]
+        if unknown:
+            arg_parser.error("--group-by on unknown column(s): {0}".format(
+                ", ".join(unknown)))
+
+    profiler = enable_profiling() if args['profile'] else None
+    try:
+        visualize(args)
+    finally:
+        if profiler is not None:
+            profiler.save(args['profile'])
+
+
+def visualize(args):
+    """Runs the visualization asked for on the command line; args is the
+    dict of parsed arguments"""
+    if args['incremental']:
+        visualize_incremental(args)
+        return
+
+    # With more than one worker, every process parses its own slice of
+    # the file and we only merge their counts or map features here.
+    if (args['workers'] > 1 and args['type'] in ('Days', 'Type', 'Map') and
+            not args['cluster'] and not args['split_by']):
+        if args['type'] in ('Days', 'Type'):
+            column = "DayOfWeek" if args['type'] == 'Days' else "Category"
+            with stage("parallel_count") as current:
+                counter = parallel_count(args['csvfile'], args['delimiter'],
+                                         column, args['workers'],
+                                         args['where'])
+                if current is not None:
+                    current.rows = sum(counter.values())
+            if args['type'] == 'Days':
+                plot_days(counter)
+            else:
+                plot_type(counter)
+        else:
+            report = Counter()
+            with stage("create_map") as current:
+                save_map(parallel_features(args['csvfile'],
+                                           args['delimiter'],
+                                           partial(iter_features,
+                                                   bounds=args['bbox']),
+                                           args['workers'], report,
+                                           args['where']),
+                         args['gzip'])
+                if current is not None:
+                    current.rows = report['accepted'] + report['rejected']
+            print_report(report)
+        return
+
+    # Call appropriate visualization function.  Each of them gets just
+    # the columns it needs as a columnar table.
+    if args['split_by'] and args['type'] in ('Days', 'Type'):
+        column = "DayOfWeek" if args['type'] == 'Days' else "Category"
+        split_column = ("Date" if args['split_by'] == 'year'
+                        else args['split_by'])
+        visualize_split(load_data(args, [column, split_column]),
+                        args['type'], args['split_by'], args['workers'])
+    elif args['type'] == 'Days':
+        visualize_days(load_data(args, ["DayOfWeek"]))
     elif args['type'] == "Type":
-        visualize_type(data)
+        visualize_type(load_data(args, ["Category"]))
+    elif args['type'] == "Time":
+        visualize_time(load_data(args, ["Date", "Time"]),
+                       args['frequency'], args['since'], args['until'])
+    elif args['type'] == 'all':
+        columns = ["DayOfWeek", "Category", "Descript", "Date", "X", "Y"]
+        for group_by in args['group_by']:
+            columns.extend(name for name in group_by if name not in columns)
+        report = visualize_all(load_data(args, columns), args['group_by'],
+                               args['gzip'], args['bbox'], args['cluster'])
+        if report is not None:
+            print_report(report)
+    elif args['cluster']:
+        create_cluster_map(load_data(args, ["Category", "X", "Y"]),
+                           args['cluster'], args['gzip'], args['bbox'])
     else:
-        create_map(data)
+        print_report(create_map(load_data(args, ["Category", "Descript",
+                                                 "Date", "X", "Y"]),
+                                args['gzip'], args['bbox']))
 
 if __name__ == "__main__":
     main()
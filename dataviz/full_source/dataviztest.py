@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import dataviz
+from incidents import IncidentTable
+from paralleltest import make_rows, write_csv
+
+
+class TestArguments(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "incidents.csv")
+        write_csv(self.path, make_rows(10))
+        self.argv = sys.argv
+        self.stderr = sys.stderr
+        sys.stderr = open(os.devnull, "w")
+
+    def tearDown(self):
+        sys.stderr.close()
+        sys.stderr = self.stderr
+        sys.argv = self.argv
+        shutil.rmtree(self.directory)
+
+    def assertRejected(self, *arguments):
+        """Checks that main() stops with a usage error, before doing
+        anything"""
+        sys.argv = ["dataviz.py", "--csvfile", self.path] + list(arguments)
+        with self.assertRaises(SystemExit) as context:
+            dataviz.main()
+        self.assertEqual(context.exception.code, 2)
+
+    def test_unknown_where_column(self):
+        self.assertRejected("--type", "Type", "--where", "Foo=1")
+        self.assertRejected("--type", "Type", "--where", "Category=FRAUD",
+                            "--where", "Foo in (1,2)")
+
+    def test_missing_file(self):
+        self.path = os.path.join(self.directory, "missing.csv")
+        self.assertRejected("--type", "Type")
+
+    def test_group_by(self):
+        self.assertRejected("--type", "Type", "--group-by", "PdDistrict")
+        self.assertRejected("--type", "all", "--group-by", "PdDistrict",
+                            "--group-by", "Category", "Foo")
+
+
+class TestVisualizeAll(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "incidents.csv")
+        write_csv(self.path, make_rows(100))
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_clustered_map(self):
+        columns = ["DayOfWeek", "Category", "Descript", "Date", "X", "Y"]
+        tables = (IncidentTable.from_csv(self.path, ",", columns),
+                  dataviz.iter_parse(self.path, ","))
+        for data, zoom_levels in zip(tables, ([10, 14], [12])):
+            self.assertIsNone(dataviz.visualize_all(
+                data, bounds=(-123, 37, -122, 38), zoom_levels=zoom_levels))
+        files = set(os.listdir(self.directory))
+        self.assertNotIn("file_sf.geojson", files)
+        for zoom in (10, 12, 14):
+            with open("file_sf_z{0}.geojson".format(zoom)) as f:
+                features = json.load(f)["features"]
+            # Rows without X (every ninth) are left out.
+            self.assertEqual(sum(feature["properties"]["count"]
+                                 for feature in features), 88)
+
+
+if __name__ == "__main__":
+    unittest.main()
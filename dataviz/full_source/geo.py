@@ -0,0 +1,204 @@
+"""
+Data Visualization Project - GeoJSON output
+
+Writes a GeoJSON FeatureCollection feature by feature, so that a map of
+millions of incidents never has to be held in memory as one big dict.
+
+For maps too large to show every single incident, the incidents can
+also be clustered into a grid per zoom level, with one feature per
+grid cell.
+"""
+import gzip
+import json
+import os
+
+import numpy as np
+
+
+class FeatureCollectionWriter(object):
+    """Streams GeoJSON features into a FeatureCollection file.
+
+    Use it as a context manager; the collection is closed (and the file
+    becomes valid GeoJSON) when the with-block ends:
+
+        with FeatureCollectionWriter("file_sf.geojson") as writer:
+            for feature in features:
+                writer.write(feature)
+
+    The features go into a temporary file next to out_file first, which
+    only takes its place once the collection is complete.  If the
+    with-block ends with an exception, the temporary file is removed and
+    out_file is left as it was, instead of ending up as a truncated map
+    that still looks valid.
+
+    With compress=True the output is gzip-compressed on the fly.
+    """
+
+    def __init__(self, out_file, compress=False):
+        self.out_file = out_file
+        self.temp_file = out_file + ".tmp"
+        if compress:
+            self.out = gzip.open(self.temp_file, "wt")
+        else:
+            self.out = open(self.temp_file, "w")
+        self.encode = json.JSONEncoder(separators=(", ", ": ")).encode
+        self.count = 0
+        self.out.write('{"type": "FeatureCollection", "features": [')
+
+    def write(self, feature):
+        """Appends one feature to the collection"""
+        if self.count:
+            self.out.write(", ")
+        self.out.write(self.encode(feature))
+        self.count += 1
+
+    def write_all(self, features):
+        """Appends every feature of an iterable to the collection"""
+        for feature in features:
+            self.write(feature)
+
+    def close(self):
+        """Ends the collection, closes the file and moves it into place"""
+        self.out.write("]}")
+        self.out.close()
+        os.rename(self.temp_file, self.out_file)
+
+    def abort(self):
+        """Closes the file without ending the collection, and removes it"""
+        self.out.close()
+        try:
+            os.remove(self.temp_file)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+# Bounding box (min X, min Y, max X, max Y) around San Francisco.  Zero
+# coordinates as well as SFPD's placeholder location (-120.5, 90) fall
+# outside of it.
+SF_BOUNDS = (-122.6, 37.6, -122.3, 37.9)
+
+
+def parse_coordinates(values):
+    """Converts a list of coordinate strings into a float64 array in one
+    go.  Empty or malformed values become NaN."""
+    try:
+        return np.array(values, dtype=np.str_).astype(np.float64)
+    except ValueError:
+        # At least one value isn't a number; fall back to converting
+        # them one by one.
+        coordinates = np.empty(len(values), dtype=np.float64)
+        for index, value in enumerate(values):
+            try:
+                coordinates[index] = float(value)
+            except ValueError:
+                coordinates[index] = np.nan
+        return coordinates
+
+
+def valid_coordinates(x, y, bounds=SF_BOUNDS):
+    """Returns a boolean mask of the points that can be put on a map.
+
+    Missing coordinates and points outside of bounds would throw off the
+    map, so we skip them.  Without bounds, only missing and zero
+    coordinates are rejected.
+    """
+    mask = np.isfinite(x) & np.isfinite(y)
+    if bounds is None:
+        return mask & (x != 0) & (y != 0)
+    min_x, min_y, max_x, max_y = bounds
+    return mask & (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+
+
+class GridBins(object):
+    """Incidents binned into the grid of one zoom level.
+
+    The grid splits the 360 degrees of longitude into 2 ** zoom cells,
+    like the tiles of a web map, and uses square cells for the latitude.
+    features() yields one GeoJSON point feature per non-empty cell, which
+    sits on the mean position of its incidents and carries the number of
+    incidents and their breakdown by category.
+
+    The bins can be filled from many tables one after the other, e.g.
+    from each day's new incidents, and turned into a JSON-friendly dict
+    and back, to keep them around between runs.
+    """
+
+    def __init__(self, zoom, cells=None):
+        self.zoom = zoom
+        # Cell number -> [count, sum of X, sum of Y, {category: count}]
+        self.cells = cells if cells is not None else {}
+
+    def update(self, table, bounds=SF_BOUNDS):
+        """Adds the incidents of an IncidentTable to the bins"""
+        x = table.columns["X"]
+        y = table.columns["Y"]
+        categories = table.columns["Category"]
+        mask = valid_coordinates(x, y, bounds)
+        x, y, categories = x[mask], y[mask], categories[mask]
+
+        # Number every cell of the grid, and give each incident the number
+        # of the cell it falls into.
+        cell_size = 360.0 / 2 ** self.zoom
+        rows = int(np.ceil(180.0 / cell_size))
+        column = np.floor((x + 180.0) / cell_size).astype(np.int64)
+        row = np.floor((y + 90.0) / cell_size).astype(np.int64)
+        cells, cell_index = np.unique(column * rows + row,
+                                      return_inverse=True)
+        cell_index = cell_index.ravel()
+
+        counts = np.bincount(cell_index, minlength=len(cells))
+        sum_x = np.bincount(cell_index, weights=x, minlength=len(cells))
+        sum_y = np.bincount(cell_index, weights=y, minlength=len(cells))
+
+        # One bincount over (cell, category) pairs gives the breakdown of
+        # all cells at once.
+        labels = table.labels["Category"]
+        breakdown = np.bincount(cell_index * len(labels) + categories,
+                                minlength=len(cells) * len(labels))
+        breakdown = breakdown.reshape(len(cells), len(labels))
+
+        for index, cell in enumerate(cells.tolist()):
+            count, total_x, total_y, per_category = self.cells.setdefault(
+                cell, [0, 0.0, 0.0, {}])
+            self.cells[cell][0:3] = [count + int(counts[index]),
+                                     total_x + float(sum_x[index]),
+                                     total_y + float(sum_y[index])]
+            for code in np.flatnonzero(breakdown[index]):
+                label = labels[code]
+                per_category[label] = (per_category.get(label, 0) +
+                                       int(breakdown[index][code]))
+
+    def features(self):
+        """Yields one GeoJSON point feature per non-empty cell"""
+        for cell in sorted(self.cells):
+            count, total_x, total_y, per_category = self.cells[cell]
+            yield {'type': 'Feature',
+                   'id': cell,
+                   'properties': {'zoom': self.zoom,
+                                  'count': count,
+                                  'categories': per_category},
+                   'geometry': {'type': 'Point',
+                                'coordinates': (total_x / count,
+                                                total_y / count)}}
+
+    def to_dict(self):
+        """Returns the bins as a dict that can be dumped to JSON"""
+        return {'zoom': self.zoom,
+                'cells': dict((str(cell), values)
+                              for cell, values in self.cells.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restores bins from a dict returned by to_dict()"""
+        return cls(data['zoom'], dict((int(cell), values)
+                                      for cell, values in
+                                      data['cells'].items()))
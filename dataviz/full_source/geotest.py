@@ -0,0 +1,67 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from aggregate import Engine, FeatureSink
+from geo import FeatureCollectionWriter
+
+
+FEATURES = [{"type": "Feature", "id": number,
+             "geometry": {"type": "Point", "coordinates": [-122.4, 37.7]}}
+            for number in range(3)]
+
+
+def broken_features(lines, report, start=0):
+    """iter_features for a FeatureSink that fails halfway"""
+    yield FEATURES[0]
+    raise ValueError("broken row")
+
+
+class TestFeatureCollectionWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "file_sf.geojson")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_complete_collection(self):
+        with FeatureCollectionWriter(self.path) as writer:
+            writer.write_all(FEATURES)
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)["features"], FEATURES)
+        self.assertEqual(os.listdir(self.directory), ["file_sf.geojson"])
+
+    def test_compressed(self):
+        self.path += ".gz"
+        with FeatureCollectionWriter(self.path, compress=True) as writer:
+            writer.write_all(FEATURES)
+        with gzip.open(self.path, "rt") as f:
+            self.assertEqual(json.load(f)["features"], FEATURES)
+
+    def test_exception_leaves_the_old_file(self):
+        with open(self.path, "w") as f:
+            f.write("old map")
+        with self.assertRaises(ValueError):
+            with FeatureCollectionWriter(self.path) as writer:
+                writer.write(FEATURES[0])
+                raise ValueError("broken row")
+        with open(self.path) as f:
+            self.assertEqual(f.read(), "old map")
+        self.assertEqual(os.listdir(self.directory), ["file_sf.geojson"])
+
+    def test_engine_aborts_on_exception(self):
+        sink = FeatureSink(FeatureCollectionWriter(self.path),
+                           broken_features)
+        engine = Engine()
+        engine.register(sink)
+        with self.assertRaises(ValueError):
+            engine.run([{"X": "1"}])
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+"""
+Data Visualization Project - Columnar incident table
+
+Instead of one dict per row, the incidents are kept as one NumPy array
+per column.  Text columns with a small set of distinct values (day of
+week, category, district, ...) are dictionary-encoded: every value is
+replaced by an integer code pointing into a list of labels.  Counting
+incidents per label then boils down to a single np.bincount call.
+"""
+from array import array
+from collections import Counter
+
+import csv
+
+import numpy as np
+
+
+# Columns holding coordinates; these are stored as float64.
+COORDINATE_COLUMNS = ("X", "Y")
+
+# Columns loaded when nothing else is asked for: everything the
+# visualizations in dataviz.py look at.
+DEFAULT_COLUMNS = ("Category", "Descript", "DayOfWeek", "Date", "Time",
+                   "PdDistrict", "X", "Y")
+
+
+def _to_float(value):
+    """Converts a coordinate to float, mapping empty cells to NaN"""
+    return float(value) if value else float("nan")
+
+
+def _reencode(codes, labels):
+    """Renumbers the codes of a dictionary-encoded column so that only the
+    labels they use are left, in the order they first appear.  Returns
+    the new codes and labels."""
+    used, first = np.unique(codes, return_index=True)
+    used = used[np.argsort(first)]
+    mapping = np.zeros(len(labels), dtype=np.int64)
+    mapping[used] = np.arange(len(used))
+    dtype = np.min_scalar_type(max(len(used) - 1, 0))
+    return (mapping[codes].astype(dtype),
+            [labels[code] for code in used.tolist()])
+
+
+class IncidentTable(object):
+    """Incidents stored column by column.
+
+    `columns` maps a column name to its NumPy array.  For every
+    dictionary-encoded column, `labels` maps the column name to the list
+    of distinct values, so that labels[name][code] is the original text.
+    """
+
+    def __init__(self, columns, labels):
+        self.columns = columns
+        self.labels = labels
+
+    @classmethod
+    def from_rows(cls, rows, fields, columns=DEFAULT_COLUMNS):
+        """Builds a table out of raw CSV rows (lists of strings).
+
+        Only the given columns are kept; all others are dropped right
+        away without ever being stored.
+        """
+        indexes = [fields.index(name) for name in columns]
+        coded = [(i, name) for i, name in zip(indexes, columns)
+                 if name not in COORDINATE_COLUMNS]
+        floats = [(i, name) for i, name in zip(indexes, columns)
+                  if name in COORDINATE_COLUMNS]
+
+        # array.array grows in place with a few bytes per value, which is
+        # far cheaper than a list of Python ints or floats.
+        codes = dict((name, array("l")) for _, name in coded)
+        lookups = dict((name, {}) for _, name in coded)
+        values = dict((name, array("d")) for _, name in floats)
+
+        for row in rows:
+            for i, name in coded:
+                lookup = lookups[name]
+                codes[name].append(lookup.setdefault(row[i], len(lookup)))
+            for i, name in floats:
+                values[name].append(_to_float(row[i]))
+
+        table_columns = {}
+        labels = {}
+        for name, lookup in lookups.items():
+            # Store the codes in the smallest unsigned type that fits.
+            dtype = np.min_scalar_type(max(len(lookup) - 1, 0))
+            table_columns[name] = np.asarray(codes[name], dtype=dtype)
+            names = [None] * len(lookup)
+            for label, code in lookup.items():
+                names[code] = label
+            labels[name] = names
+        for name, column in values.items():
+            table_columns[name] = np.asarray(column, dtype=np.float64)
+
+        return cls(table_columns, labels)
+
+    @classmethod
+    def from_csv(cls, raw_file, delimiter, columns=DEFAULT_COLUMNS,
+                 where=None):
+        """Loads the given columns of a raw CSV file into a table.
+
+        With a list of predicates.Condition as where, only the rows
+        matching all of them are loaded.
+        """
+        # Imported here, since predicates itself needs this module.
+        from predicates import compile_conditions
+
+        with open(raw_file) as opened_file:
+            csv_data = csv.reader(opened_file, delimiter=delimiter)
+            fields = next(csv_data)
+            keep = compile_conditions(where, fields)
+            if keep is not None:
+                csv_data = (row for row in csv_data if keep(row))
+            return cls.from_rows(csv_data, fields, columns)
+
+    def save(self, out_file, **meta):
+        """Writes the table into an uncompressed .npz file.
+
+        Extra keyword arguments are stored alongside as strings, which
+        lets a cache remember what the table was built from.
+        """
+        arrays = {}
+        for name, column in self.columns.items():
+            arrays["column:" + name] = column
+        for name, labels in self.labels.items():
+            arrays["labels:" + name] = np.array(labels, dtype=np.str_)
+        for key, value in meta.items():
+            arrays["meta:" + key] = np.array(value, dtype=np.str_)
+        np.savez(out_file, **arrays)
+
+    @classmethod
+    def load(cls, in_file):
+        """Reads a table written by save().  Returns the table and the dict
+        of extra values given to save()."""
+        columns = {}
+        labels = {}
+        meta = {}
+        with np.load(in_file, allow_pickle=False) as arrays:
+            for key in arrays.files:
+                kind, name = key.split(":", 1)
+                if kind == "column":
+                    columns[name] = arrays[key]
+                elif kind == "labels":
+                    labels[name] = arrays[key].tolist()
+                else:
+                    meta[name] = str(arrays[key])
+        return cls(columns, labels), meta
+
+    def take(self, mask):
+        """Returns a new table with only the rows selected by mask.
+
+        Labels no longer used by any of these rows are dropped, and the
+        others numbered in the order they first appear, just as if only
+        these rows had been parsed.
+        """
+        columns = {}
+        labels = {}
+        for name, column in self.columns.items():
+            column = column[mask]
+            if name in self.labels:
+                column, labels[name] = _reencode(column, self.labels[name])
+            columns[name] = column
+        return IncidentTable(columns, labels)
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def iter_rows(self, indexes):
+        """Yields the rows at the given indexes as JSON-like dicts, just
+        like parsing the CSV file would (apart from coordinates, which
+        come out as floats)."""
+        columns = [(name, self.columns[name], self.labels.get(name))
+                   for name in self.columns]
+        for index in indexes:
+            row = {}
+            for name, column, labels in columns:
+                if labels is None:
+                    row[name] = float(column[index])
+                else:
+                    row[name] = labels[column[index]]
+            yield row
+
+    def counts(self, name):
+        """Counts the rows per label of a dictionary-encoded column.
+
+        Returns a Counter, just like counting over row dicts would.
+        """
+        labels = self.labels[name]
+        totals = np.bincount(self.columns[name], minlength=len(labels))
+        return Counter(dict(zip(labels, totals.tolist())))
+
+    def grouped_counts(self, groups, size, name):
+        """Counts the rows per label of a dictionary-encoded column,
+        separately for every group.
+
+        groups holds the group number (below size) of every row.  Returns
+        one Counter per group; all of them list every label, even with a
+        count of 0.
+        """
+        labels = self.labels[name]
+        pairs = groups.astype(np.int64) * len(labels) + self.columns[name]
+        totals = np.bincount(pairs, minlength=size * len(labels))
+        return [Counter(dict(zip(labels, row.tolist())))
+                for row in totals.reshape(size, len(labels))]
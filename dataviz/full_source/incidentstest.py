@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from dataviz import load_data
+from incidents import IncidentTable
+from paralleltest import make_rows, write_csv
+from predicates import parse_where
+
+
+class TestTake(unittest.TestCase):
+    def test_unused_labels_are_dropped(self):
+        table = IncidentTable(
+            {"Category": np.array([0, 1, 2, 1, 0], dtype=np.uint8),
+             "X": np.arange(5.0)},
+            {"Category": ["FRAUD", "ASSAULT", "WARRANTS"]})
+        taken = table.take(np.array([False, False, True, True, False]))
+        # Numbered in the order they first appear in the rows taken.
+        self.assertEqual(taken.labels["Category"], ["WARRANTS", "ASSAULT"])
+        self.assertEqual(taken.columns["Category"].tolist(), [0, 1])
+        self.assertEqual(taken.columns["X"].tolist(), [2.0, 3.0])
+        self.assertEqual(taken.counts("Category"),
+                         {"WARRANTS": 1, "ASSAULT": 1})
+
+    def test_nothing_taken(self):
+        table = IncidentTable({"Category": np.array([0, 1], dtype=np.uint8)},
+                              {"Category": ["FRAUD", "ASSAULT"]})
+        taken = table.take(np.zeros(2, dtype=bool))
+        self.assertEqual(len(taken), 0)
+        self.assertEqual(taken.counts("Category"), {})
+
+
+class TestLoadData(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "incidents.csv")
+        write_csv(self.path, make_rows(100))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self, where, no_cache):
+        args = {"csvfile": self.path, "delimiter": ",", "no_cache": no_cache,
+                "where": [parse_where(condition) for condition in where]}
+        return load_data(args, ["Category", "DayOfWeek", "X"])
+
+    def test_cached_and_uncached_agree(self):
+        for where in ([], ["Category in (WARRANTS,ASSAULT)"],
+                      ["DayOfWeek = Friday", "Category != FRAUD"]):
+            uncached = self.load(where, True)
+            # The first time fills the cache, the second reads from it.
+            for _ in range(2):
+                cached = self.load(where, False)
+                self.assertEqual(cached.labels, uncached.labels)
+                for name in ("Category", "DayOfWeek"):
+                    self.assertEqual(cached.columns[name].tolist(),
+                                     uncached.columns[name].tolist())
+                    self.assertEqual(cached.counts(name),
+                                     uncached.counts(name))
+
+
+if __name__ == "__main__":
+    unittest.main()
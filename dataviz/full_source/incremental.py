@@ -0,0 +1,203 @@
+"""
+Data Visualization Project - Incremental ingestion
+
+The SFPD export only ever grows at the end.  Instead of parsing the whole
+file on every run, we keep the aggregates (incidents per day of week,
+per category and per grid cell) in a small JSON state file, together
+with the byte offset up to which the CSV file has been read.  The next
+run only parses what was appended since, and adds it to the aggregates.
+
+If the file no longer starts the way it did (e.g. it was replaced by a
+fresh export), or is shorter than the offset, everything is read again
+from scratch.
+
+A last record without a newline at its end may still be in the middle
+of being written.  The offset saved always stops before it, so the next
+run reads it again, complete or not.  The run that finds it only counts
+it if it has all its fields; a half-written one is left for later.
+"""
+from collections import Counter
+
+import csv
+import hashlib
+import io
+import json
+import os
+
+from geo import SF_BOUNDS, GridBins
+from incidents import IncidentTable
+from predicates import compile_conditions
+
+
+# Size of the blocks the new part of the file is read and parsed in.
+BLOCK_SIZE = 64 * 1024 * 1024
+
+# Number of bytes at the start of the file used to recognize it again.
+FINGERPRINT_SIZE = 64 * 1024
+
+
+def _fingerprint(opened_file, size):
+    """Hashes the first bytes of the file (at most size of them)"""
+    opened_file.seek(0)
+    return hashlib.sha1(opened_file.read(min(size, FINGERPRINT_SIZE))
+                        ).hexdigest()
+
+
+def _parse(data, delimiter, fields, keep):
+    """Parses CSV records (bytes) into an IncidentTable of the columns the
+    aggregates need, dropping those not matching keep"""
+    rows = csv.reader(io.StringIO(data.decode("utf-8"), newline=None),
+                      delimiter=delimiter)
+    if keep is not None:
+        rows = (row for row in rows if keep(row))
+    return IncidentTable.from_rows(rows, fields,
+                                   ["DayOfWeek", "Category", "X", "Y"])
+
+
+def _complete_records(data):
+    """Returns the length of the part of data holding complete records:
+    up to the last newline that is not inside a quoted field."""
+    end = data.rfind(b"\n")
+    while end != -1 and data.count(b'"', 0, end) % 2:
+        end = data.rfind(b"\n", 0, end)
+    return end + 1
+
+
+def _is_whole_record(data, delimiter, fields):
+    """Tells whether data (bytes without a newline at the end) holds a
+    single record with as many fields as the header.  A record that is
+    still being written usually has fewer, an open quote or a cut
+    UTF-8 character."""
+    if not data.strip() or data.count(b'"') % 2:
+        return False
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    rows = list(csv.reader(io.StringIO(text, newline=None),
+                           delimiter=delimiter))
+    return len(rows) == 1 and len(rows[0]) == len(fields)
+
+
+class IncrementalState(object):
+    """Aggregates of a CSV file up to a byte offset.
+
+    `days` and `categories` count incidents per day of week and per
+    category, `grids` holds the GridBins per zoom level.
+    """
+
+    def __init__(self, settings):
+        # Everything that has to stay the same for the aggregates to be
+        # reusable: delimiter, filters, zoom levels and bounds.
+        self.settings = settings
+        self.offset = 0
+        self.fingerprint = None
+        self.fields = None
+        self.rows = 0
+        self.days = Counter()
+        self.categories = Counter()
+        self.grids = dict((zoom, GridBins(zoom))
+                          for zoom in settings['zoom_levels'])
+
+    @classmethod
+    def load(cls, state_file, settings):
+        """Reads the state file, or starts from scratch if there is none or
+        it was written with different settings"""
+        try:
+            with open(state_file) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return cls(settings)
+        if data.get('settings') != settings:
+            return cls(settings)
+
+        state = cls(settings)
+        state.offset = data['offset']
+        state.fingerprint = data['fingerprint']
+        state.fields = data['fields']
+        state.rows = data['rows']
+        state.days = Counter(data['days'])
+        state.categories = Counter(data['categories'])
+        state.grids = dict((grid['zoom'], GridBins.from_dict(grid))
+                           for grid in data['grids'])
+        return state
+
+    def save(self, state_file):
+        """Writes the state file, replacing the previous one only once the
+        new one is complete"""
+        temp_file = state_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump({'settings': self.settings,
+                       'offset': self.offset,
+                       'fingerprint': self.fingerprint,
+                       'fields': self.fields,
+                       'rows': self.rows,
+                       'days': self.days,
+                       'categories': self.categories,
+                       'grids': [grid.to_dict()
+                                 for grid in self.grids.values()]}, f)
+        os.rename(temp_file, state_file)
+
+    def update(self, table):
+        """Adds the incidents of an IncidentTable to the aggregates"""
+        self.rows += len(table)
+        self.days.update(table.counts("DayOfWeek"))
+        self.categories.update(table.counts("Category"))
+        for grid in self.grids.values():
+            grid.update(table, self.settings['bounds'])
+
+
+def ingest(raw_file, delimiter, state_file, zoom_levels=(), where=None,
+           bounds=SF_BOUNDS):
+    """Brings the aggregates in state_file up to date with raw_file.
+
+    Only the records appended since the last run are parsed.  Returns the
+    updated IncrementalState, which is also saved to state_file.
+
+    If the file doesn't end with a newline, its last record is included
+    in the returned aggregates (if it has all its fields) but not in the
+    saved ones, since it may not be complete yet.
+    """
+    where = where or []
+    settings = {'delimiter': delimiter,
+                'where': [condition.key() for condition in where],
+                'zoom_levels': sorted(zoom_levels),
+                'bounds': list(bounds)}
+    state = IncrementalState.load(state_file, settings)
+
+    size = os.path.getsize(raw_file)
+    with open(raw_file, 'rb') as opened_file:
+        # Start over if the part of the file we have already read has
+        # changed since.
+        if (state.offset > size or
+                _fingerprint(opened_file, state.offset) != state.fingerprint):
+            state = IncrementalState(settings)
+
+        if state.fields is None:
+            opened_file.seek(0)
+            header = opened_file.readline().decode("utf-8")
+            state.fields = next(csv.reader([header], delimiter=delimiter))
+            state.offset = opened_file.tell()
+        keep = compile_conditions(where, state.fields)
+
+        # Parse the new records block by block, never splitting a record.
+        opened_file.seek(state.offset)
+        while True:
+            data = opened_file.read(BLOCK_SIZE)
+            end = _complete_records(data)
+            if not end:
+                break
+            opened_file.seek(state.offset + end)
+            state.update(_parse(data[:end], delimiter, state.fields, keep))
+            state.offset += end
+
+        state.fingerprint = _fingerprint(opened_file, state.offset)
+
+    state.save(state_file)
+
+    # What is left is a last record without a newline, if the file ends
+    # there.  Only count it if it looks whole.
+    if (state.offset + len(data) == size and
+            _is_whole_record(data, delimiter, state.fields)):
+        state.update(_parse(data, delimiter, state.fields, keep))
+    return state
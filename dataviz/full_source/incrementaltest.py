@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from incremental import ingest
+from paralleltest import make_rows, write_csv
+from predicates import parse_where
+
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "incidents.csv")
+        self.state_file = os.path.join(self.directory, "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def saved_rows(self):
+        with open(self.state_file) as f:
+            return json.load(f)["rows"]
+
+    def test_it_only_reads_appended_records(self):
+        rows = make_rows(80)
+        write_csv(self.path, rows[:50])
+        self.assertEqual(ingest(self.path, ",", self.state_file).rows, 50)
+        write_csv(self.path, rows)
+        state = ingest(self.path, ",", self.state_file)
+        self.assertEqual(state.rows, 80)
+        self.assertEqual(sum(state.categories.values()), 80)
+
+    def test_last_record_without_newline(self):
+        rows = make_rows(50)
+        write_csv(self.path, rows, final_newline=False)
+        self.assertEqual(ingest(self.path, ",", self.state_file).rows, 50)
+        # It may still be written to, so the saved state leaves it out...
+        self.assertEqual(self.saved_rows(), 49)
+        self.assertEqual(ingest(self.path, ",", self.state_file).rows, 50)
+        # ...and reads it again once it is complete.
+        write_csv(self.path, rows)
+        self.assertEqual(ingest(self.path, ",", self.state_file).rows, 50)
+        self.assertEqual(self.saved_rows(), 50)
+
+    def test_half_written_last_record(self):
+        rows = make_rows(50)
+        write_csv(self.path, rows)
+        with open(self.path, "ab") as f:
+            f.write(b"150060275,FRAUD,FORG")
+        # Left out, and not in the way, however many times it is read.
+        self.assertEqual(ingest(self.path, ",", self.state_file).rows, 50)
+        self.assertEqual(ingest(self.path, ",", self.state_file).rows, 50)
+        self.assertEqual(self.saved_rows(), 50)
+        # Counted once it is complete.
+        rows.append(["150060275", "FRAUD", "FORGERY", "Monday",
+                     "01/01/2003", "16:30", "NORTHERN", "NONE", "",
+                     "-122.4", "37.7"])
+        write_csv(self.path, rows)
+        state = ingest(self.path, ",", self.state_file)
+        self.assertEqual(state.rows, 51)
+        self.assertEqual(state.categories["FRAUD"], 14)
+        self.assertEqual(self.saved_rows(), 51)
+
+    def test_membership_filters_keep_the_state(self):
+        write_csv(self.path, make_rows(50))
+        where = [parse_where("Category in (FRAUD,ASSAULT,WARRANTS)")]
+        ingest(self.path, ",", self.state_file, where=where)
+        with open(self.state_file) as f:
+            saved = json.load(f)
+        # Saved in an order that doesn't depend on string hashing, which
+        # changes from one process to the next.
+        self.assertEqual(saved["settings"]["where"],
+                         [["Category", "in",
+                           ["'ASSAULT'", "'FRAUD'", "'WARRANTS'"]]])
+
+        # Mark the saved state, to tell whether the next run reuses it.
+        saved["rows"] = -1
+        with open(self.state_file, "w") as f:
+            json.dump(saved, f)
+
+        # The same filter with its values in another order is the same
+        # filter.
+        where = [parse_where("Category in (WARRANTS,FRAUD,ASSAULT)")]
+        self.assertEqual(ingest(self.path, ",", self.state_file,
+                                where=where).rows, -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,281 @@
+"""
+Data Visualization Project - Memory-mapped CSV reader
+
+csv.reader builds a new string for every field of every row, including
+all the columns no visualization ever looks at (Resolution, Location,
+IncidntNum, ...).  This reader maps the file into memory instead and
+looks at its bytes through a NumPy array without copying them:
+
+  * the record and field boundaries of a whole block are found at once,
+    by comparing every byte with the delimiter and the newline, and
+    ignoring the ones inside quoted fields;
+  * only the columns that were asked for (column projection) are cut
+    out of the block, into one fixed-width byte array per column;
+  * text columns are dictionary-encoded right away, so every distinct
+    value is decoded into a Python string only once per block;
+  * the pages of a block are handed back to the kernel once it is done,
+    so the mapped file doesn't end up in memory as a whole.
+
+Blocks that don't look like regular CSV (e.g. rows with a missing
+field) are handed to csv.reader instead, so the result is always the
+same IncidentTable IncidentTable.from_csv() would build.
+"""
+import csv
+import io
+import mmap
+
+import numpy as np
+
+from geo import parse_coordinates
+from incidents import COORDINATE_COLUMNS, DEFAULT_COLUMNS, IncidentTable
+
+
+# Number of bytes looked at in one go.  Finding the boundaries needs a
+# few temporary bytes per byte of the block, so this also bounds the
+# extra memory needed.
+BLOCK_SIZE = 512 * 1024
+
+# _cut() gives up on a fixed-width array for a column once that would
+# take more than this many times the bytes of its values (plus one per
+# record).
+WIDTH_FACTOR = 4
+
+QUOTE = ord('"')
+NEWLINE = ord("\n")
+RETURN = ord("\r")
+
+
+def _quoted(block):
+    """Tells for every byte of block whether it lies within quotes: an odd
+    number of quotes precede it.  Doubled quotes within a quoted field
+    cancel each other out."""
+    return np.bitwise_xor.accumulate((block == QUOTE).view(np.uint8))
+
+
+def _separators(block, quoted, delimiter, fields):
+    """Finds the positions of the delimiters and newlines ending every
+    field of the records in block.
+
+    Returns an array with one row per record and one column per field,
+    or None if some record doesn't have exactly `fields` fields.
+    """
+    ends = (block == delimiter) | (block == NEWLINE)
+    positions = np.flatnonzero(ends & (quoted == 0))
+    if len(positions) % fields:
+        return None
+    positions = positions.reshape(-1, fields)
+    if not (block[positions[:, -1]] == NEWLINE).all():
+        return None
+    return positions
+
+
+def _cut(block, positions, index):
+    """Copies field number `index` of every record out of block into a
+    fixed-width byte string array (or, if a few of the values are much
+    longer than the others, an object array of bytes).
+
+    Quoted fields keep their quotes, so that they can be told apart from
+    unquoted ones when the labels are decoded.
+    """
+    if index:
+        starts = positions[:, index - 1] + 1
+    else:
+        starts = np.concatenate([[0], positions[:-1, -1] + 1])
+    ends = positions[:, index].copy()
+    # Drop the "\r" of "\r\n" line ends.
+    ends[(block[ends - 1] == RETURN) & (ends > starts)] -= 1
+
+    lengths = ends - starts
+    width = max(int(lengths.max()), 1)
+    total = int(lengths.sum())
+    if len(lengths) * width > WIDTH_FACTOR * (total + len(lengths)):
+        # A few values are far longer than the rest; a fixed-width array
+        # would pad every record to their length.  Slice the records one
+        # by one instead.
+        raw = memoryview(block)
+        return np.array([raw[start:end].tobytes() for start, end
+                         in zip(starts.tolist(), ends.tolist())],
+                        dtype=object)
+
+    # Copy the fields byte column by byte column, straight into the
+    # zero-padded buffer of the result.  With the records ordered longest
+    # first, those still having an i-th byte are always the first ones,
+    # so only bytes that exist are copied, and all temporary arrays hold
+    # one value per record rather than one per byte.
+    values = np.zeros((len(lengths), width), dtype=np.uint8)
+    order = np.argsort(-lengths, kind="mergesort")
+    sources = starts[order]
+    longer = np.cumsum(np.bincount(lengths, minlength=width + 1)[::-1])
+    for i in range(width):
+        # Number of records longer than i bytes
+        count = int(longer[width - i - 1])
+        values[order[:count], i] = block[sources[:count] + i]
+    return values.view("S{0}".format(width)).ravel()
+
+
+def _decode(value):
+    """Turns the raw bytes of one field into its text"""
+    text = value.decode("utf-8")
+    if text.startswith('"'):
+        text = text[1:-1].replace('""', '"')
+        # Line ends within quotes become "\n", like they do when reading
+        # the file in text mode.
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+class _CodedColumn(object):
+    """Dictionary-encodes one column, block by block.
+
+    Labels are numbered in the order they first appear in the file, just
+    like IncidentTable.from_rows() does.
+    """
+
+    def __init__(self):
+        self.lookup = {}
+        self.blocks = []
+
+    def add(self, values):
+        """Adds a block of raw field bytes"""
+        uniques, first, inverse = np.unique(values, return_index=True,
+                                            return_inverse=True)
+        codes = np.empty(len(uniques), dtype=np.int64)
+        for index in np.argsort(first, kind="mergesort").tolist():
+            codes[index] = self.lookup.setdefault(_decode(uniques[index]),
+                                                  len(self.lookup))
+        self._append(codes[inverse.ravel()])
+
+    def add_text(self, values):
+        """Adds a block of already decoded values"""
+        lookup = self.lookup
+        self._append(np.array(
+            [lookup.setdefault(value, len(lookup)) for value in values],
+            dtype=np.int64))
+
+    def _append(self, codes):
+        # Every block is kept in the smallest type its codes fit into;
+        # np.concatenate() picks one large enough for all of them.
+        dtype = np.min_scalar_type(max(len(self.lookup) - 1, 0))
+        self.blocks.append(codes.astype(dtype))
+
+    def finish(self):
+        """Returns the codes of all rows and the list of labels"""
+        dtype = np.min_scalar_type(max(len(self.lookup) - 1, 0))
+        codes = np.concatenate(self.blocks or [np.empty(0, dtype)])
+        self.blocks = []
+        labels = [None] * len(self.lookup)
+        for label, code in self.lookup.items():
+            labels[code] = label
+        return codes.astype(dtype, copy=False), labels
+
+
+def _coordinates(values):
+    """Converts a block of raw field bytes into floats.  Empty or
+    malformed values become NaN."""
+    try:
+        return values.astype(np.float64)
+    except ValueError:
+        return parse_coordinates([_decode(value) for value in values])
+
+
+def read_table(raw_file, delimiter, columns=DEFAULT_COLUMNS):
+    """Loads the given columns of a raw CSV file into an IncidentTable,
+    leaving all other columns untouched in the mapped file."""
+    with open(raw_file, "rb") as opened_file:
+        mapped = mmap.mmap(opened_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _read_mapped(mapped, delimiter, columns)
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            # After an error, the traceback still holds arrays looking
+            # into the mapping; it goes away together with them.
+            pass
+
+
+def _release(mapped, released, end):
+    """Tells the kernel that the pages of the mapping before end won't be
+    needed again (those before released already were), so they don't
+    keep adding to the memory of the process.  Returns the new value of
+    released.  Without mmap.madvise (before Python 3.8), this does
+    nothing."""
+    end -= end % mmap.PAGESIZE
+    if end > released and hasattr(mapped, "madvise"):
+        mapped.madvise(mmap.MADV_DONTNEED, released, end - released)
+        return end
+    return released
+
+
+def _read_mapped(mapped, delimiter, columns):
+    """Does the work of read_table() on an mmap of the file"""
+    header_end = mapped.find(b"\n") + 1 or len(mapped)
+    fields = next(csv.reader([mapped[:header_end].decode("utf-8")],
+                             delimiter=delimiter))
+    indexes = [fields.index(name) for name in columns]
+    separator = ord(delimiter)
+
+    coded = dict((name, _CodedColumn()) for name in columns
+                 if name not in COORDINATE_COLUMNS)
+    floats = dict((name, []) for name in columns if name in COORDINATE_COLUMNS)
+
+    data = np.frombuffer(mapped, dtype=np.uint8)
+    start = header_end
+    released = 0
+    size = len(data)
+    block_size = BLOCK_SIZE
+    while start < size:
+        block = data[start:start + block_size]
+        if start + len(block) == size:
+            if block[-1] != NEWLINE:
+                block = np.append(block, np.uint8(NEWLINE))
+            quoted = _quoted(block)
+        else:
+            # Cut the block after its last complete record.
+            quoted = _quoted(block)
+            newlines = np.flatnonzero((block == NEWLINE) & (quoted == 0))
+            if not len(newlines):
+                # Not even one record fits; try again with more.
+                block_size *= 2
+                continue
+            block = block[:newlines[-1] + 1]
+            quoted = quoted[:len(block)]
+        start += len(block)
+
+        positions = _separators(block, quoted, separator, len(fields))
+        if positions is None:
+            _read_irregular(block, delimiter, fields, columns, coded, floats)
+        else:
+            for name, index in zip(columns, indexes):
+                values = _cut(block, positions, index)
+                if name in coded:
+                    coded[name].add(values)
+                else:
+                    floats[name].append(_coordinates(values))
+        released = _release(mapped, released, start)
+    del data
+
+    table_columns = {}
+    labels = {}
+    for name, column in coded.items():
+        table_columns[name], labels[name] = column.finish()
+    for name, blocks in floats.items():
+        table_columns[name] = np.concatenate(
+            blocks or [np.empty(0, np.float64)])
+    return IncidentTable(table_columns, labels)
+
+
+def _read_irregular(block, delimiter, fields, columns, coded, floats):
+    """Reads a block csv.reader's way, for blocks the fast path can't
+    handle"""
+    text = block.tobytes().decode("utf-8")
+    rows = list(csv.reader(io.StringIO(text, newline=None),
+                           delimiter=delimiter))
+    for name in columns:
+        index = fields.index(name)
+        values = [row[index] for row in rows]
+        if name in coded:
+            coded[name].add_text(values)
+        else:
+            floats[name].append(parse_coordinates(values))
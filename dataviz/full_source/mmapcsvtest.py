@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import mmapcsv
+from incidents import IncidentTable
+from paralleltest import make_rows, write_csv
+
+
+COLUMNS = ["Category", "Descript", "DayOfWeek", "Location", "X", "Y"]
+
+
+def decoded(table, name):
+    """Returns a column of an IncidentTable as a list of its values"""
+    column = table.columns[name]
+    if name in table.labels:
+        return [table.labels[name][code] for code in column.tolist()]
+    return [None if np.isnan(value) else value for value in column.tolist()]
+
+
+class TestReadTable(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "incidents.csv")
+        self.rows = make_rows(300)
+        # Small blocks cut records at every possible place, and some
+        # records (those with quoted newlines) don't even fit at first.
+        self.block_size = mmapcsv.BLOCK_SIZE
+        mmapcsv.BLOCK_SIZE = 256
+
+    def tearDown(self):
+        mmapcsv.BLOCK_SIZE = self.block_size
+        shutil.rmtree(self.directory)
+
+    def check_table(self, **kwargs):
+        write_csv(self.path, self.rows, **kwargs)
+        table = mmapcsv.read_table(self.path, ",", COLUMNS)
+        expected = IncidentTable.from_csv(self.path, ",", COLUMNS)
+        self.assertEqual(len(table), len(self.rows))
+        for name in COLUMNS:
+            self.assertEqual(decoded(table, name), decoded(expected, name),
+                             name)
+        # Labels are numbered in the order they first appear.
+        self.assertEqual(table.labels["Category"],
+                         expected.labels["Category"])
+
+    def test_quoted_commas_and_newlines(self):
+        self.check_table()
+
+    def test_crlf_line_ends(self):
+        self.check_table(line_end="\r\n")
+
+    def test_missing_final_newline(self):
+        self.check_table(final_newline=False)
+        self.check_table(line_end="\r\n", final_newline=False)
+
+    def test_irregular_records(self):
+        self.rows[5].append("EXTRA")
+        self.check_table()
+
+    def test_one_very_long_field(self):
+        self.rows[7][2] = "LONG, " * 1000
+        self.check_table()
+
+    def test_cut_pads_to_the_longest_field(self):
+        block = np.frombuffer(b"a,bc\nd,\n", dtype=np.uint8)
+        positions = mmapcsv._separators(block, mmapcsv._quoted(block),
+                                        ord(","), 2)
+        values = mmapcsv._cut(block, positions, 1)
+        self.assertEqual(values.dtype, np.dtype("S2"))
+        self.assertEqual(values.tolist(), [b"bc", b""])
+
+        # Unless one of them is far longer than the others.
+        block = np.frombuffer(b"a,b\n" * 20 + b"c," + b"x" * 500 + b"\n",
+                              dtype=np.uint8)
+        positions = mmapcsv._separators(block, mmapcsv._quoted(block),
+                                        ord(","), 2)
+        values = mmapcsv._cut(block, positions, 1)
+        self.assertEqual(values.dtype, np.dtype(object))
+        self.assertEqual(values.tolist(), [b"b"] * 20 + [b"x" * 500])
+
+    def test_quoted(self):
+        block = np.frombuffer(b'a,"b,""c""",d\n', dtype=np.uint8)
+        quoted = mmapcsv._quoted(block).tolist()
+        self.assertEqual(quoted, [0, 0, 1, 1, 1, 0, 1, 1, 0, 1, 0, 0, 0, 0])
+
+    def test_separators_and_cut(self):
+        block = np.frombuffer(b'1,"x,\ny"\r\n2,z\n', dtype=np.uint8)
+        positions = mmapcsv._separators(block, mmapcsv._quoted(block),
+                                        ord(","), 2)
+        self.assertEqual(positions.tolist(), [[1, 9], [11, 13]])
+        self.assertEqual(mmapcsv._cut(block, positions, 1).tolist(),
+                         [b'"x,\ny"', b"z"])
+        self.assertIsNone(mmapcsv._separators(block, mmapcsv._quoted(block),
+                                              ord(","), 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
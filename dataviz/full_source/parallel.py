@@ -0,0 +1,183 @@
+"""
+Data Visualization Project - Multi-process parsing
+
+Splits a large CSV file into byte ranges that start and end on record
+boundaries, parses every range in its own process and merges the
+partial results.
+
+A newline only ends a record if it isn't inside a quoted field such as
+"FORGERY, CREDIT CARD".  Quotes inside a quoted field are escaped by
+doubling them, so a newline is a record boundary exactly when the
+number of quotes before it (since the last boundary) is even.
+"""
+from collections import Counter
+
+import csv
+import io
+import multiprocessing
+import os
+
+from predicates import compile_conditions
+
+
+# How much of the file we look at at once while searching boundaries.
+BLOCK_SIZE = 1024 * 1024
+
+# Upper bound for the size of one chunk, so that a worker never holds
+# more than this many bytes of raw CSV in memory.
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def _count_quotes(opened_file, start, end):
+    """Counts the quote characters between two byte offsets"""
+    opened_file.seek(start)
+    quotes = 0
+    remaining = end - start
+    while remaining > 0:
+        block = opened_file.read(min(BLOCK_SIZE, remaining))
+        if not block:
+            break
+        quotes += block.count(b'"')
+        remaining -= len(block)
+    return quotes
+
+
+def _next_boundary(opened_file, position, in_quotes):
+    """Returns the offset right after the first newline at or after
+    position that is not inside a quoted field, or None at end of file.
+
+    in_quotes tells whether position itself lies inside a quoted field.
+    """
+    opened_file.seek(position)
+    while True:
+        block = opened_file.read(BLOCK_SIZE)
+        if not block:
+            return None
+        start = 0
+        while True:
+            newline = block.find(b"\n", start)
+            if newline == -1:
+                in_quotes ^= block.count(b'"', start) & 1
+                break
+            in_quotes ^= block.count(b'"', start, newline) & 1
+            if not in_quotes:
+                return position + newline + 1
+            start = newline + 1
+        position += len(block)
+
+
+def chunk_ranges(raw_file, chunks):
+    """Splits the data rows of raw_file into at most `chunks` byte ranges.
+
+    Returns the header row and a list of (start, end) offsets.  Every
+    range starts at the beginning of a record and ends right after one.
+    """
+    size = os.path.getsize(raw_file)
+    with open(raw_file, "rb") as opened_file:
+        header_end = _next_boundary(opened_file, 0, 0) or size
+        opened_file.seek(0)
+        header = opened_file.read(header_end).decode("utf-8")
+
+        boundaries = [header_end]
+        for chunk in range(1, chunks):
+            target = header_end + (size - header_end) * chunk // chunks
+            previous = boundaries[-1]
+            if target <= previous:
+                continue
+            in_quotes = _count_quotes(opened_file, previous, target) & 1
+            boundary = _next_boundary(opened_file, target, in_quotes)
+            if boundary is None or boundary >= size:
+                break
+            boundaries.append(boundary)
+        boundaries.append(size)
+
+    return header, list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def iter_chunk(raw_file, delimiter, fields, start, end, where=None):
+    """Parses the records between two byte offsets into row dicts,
+    skipping those not matching the conditions in where"""
+    with open(raw_file, "rb") as opened_file:
+        opened_file.seek(start)
+        text = opened_file.read(end - start).decode("utf-8")
+    keep = compile_conditions(where, fields)
+    # newline=None turns "\r\n" within quoted fields into "\n", just like
+    # reading the file in text mode does.
+    for row in csv.reader(io.StringIO(text, newline=None),
+                          delimiter=delimiter):
+        if keep is None or keep(row):
+            yield dict(zip(fields, row))
+
+
+def _count_chunk(job):
+    """Worker: counts the values of one column within a chunk"""
+    raw_file, delimiter, fields, start, end, where, column = job
+    rows = iter_chunk(raw_file, delimiter, fields, start, end, where)
+    return Counter(item[column] for item in rows)
+
+
+def _feature_chunk(job):
+    """Worker: turns the rows of a chunk into GeoJSON features.
+
+    The ids of the features are relative to the chunk; the returned report
+    also tells how many (matching) rows the chunk had, which lets the
+    caller shift the ids afterwards.
+    """
+    raw_file, delimiter, fields, start, end, where, iter_features = job
+    report = Counter()
+    rows = iter_chunk(raw_file, delimiter, fields, start, end, where)
+    return report, list(iter_features(rows, report=report))
+
+
+def _jobs(raw_file, delimiter, workers, where, extra):
+    """Builds one job per chunk of raw_file"""
+    chunks = max(workers, os.path.getsize(raw_file) // MAX_CHUNK_SIZE + 1)
+    header, ranges = chunk_ranges(raw_file, chunks)
+    fields = next(csv.reader(io.StringIO(header, newline=""),
+                             delimiter=delimiter))
+    return [(raw_file, delimiter, fields, start, end, where, extra)
+            for start, end in ranges]
+
+
+def parallel_count(raw_file, delimiter, column, workers, where=None):
+    """Counts incidents per value of column using a pool of processes,
+    leaving out rows not matching the conditions in where"""
+    counter = Counter()
+    pool = multiprocessing.Pool(workers)
+    try:
+        for partial in pool.imap_unordered(
+                _count_chunk,
+                _jobs(raw_file, delimiter, workers, where, column)):
+            counter.update(partial)
+    finally:
+        pool.close()
+        pool.join()
+    return counter
+
+
+def parallel_features(raw_file, delimiter, iter_features, workers,
+                      report=None, where=None):
+    """Yields GeoJSON features for every row, in file order, built in a
+    pool of processes.
+
+    iter_features(rows, report=report) is called on the row dicts of each
+    chunk and has to count the "accepted" and "rejected" rows in report.
+    The counts of all chunks are summed up into the given report.  Rows
+    not matching the conditions in where are skipped.
+    """
+    if report is None:
+        report = Counter()
+    offset = 0
+    pool = multiprocessing.Pool(workers)
+    try:
+        for partial, features in pool.imap(
+                _feature_chunk,
+                _jobs(raw_file, delimiter, workers, where, iter_features)):
+            for feature in features:
+                feature['id'] += offset
+                yield feature
+            offset += partial['accepted'] + partial['rejected']
+            report.update(partial)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,133 @@
+from collections import Counter
+
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import parallel
+
+
+FIELDS = ["IncidntNum", "Category", "Descript", "DayOfWeek", "Date", "Time",
+          "PdDistrict", "Resolution", "Location", "X", "Y"]
+
+CATEGORIES = ["FRAUD", "ASSAULT", "LARCENY/THEFT", "WARRANTS"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday",
+        "Sunday"]
+
+
+def make_rows(count):
+    """Returns count rows whose text fields have quoted commas, quoted
+    newlines and doubled quotes in them."""
+    rows = []
+    for number in range(count):
+        descript = ["FORGERY, CREDIT CARD", "WARRANT ARREST",
+                    'SAID "HELLO"\nAND LEFT', "PLAIN"][number % 4]
+        x = "" if number % 9 == 0 else "-122.{0:04d}".format(number)
+        rows.append(["{0:09d}".format(number), CATEGORIES[number % 4],
+                     descript, DAYS[number % 7],
+                     "{0:02d}/01/2003".format(1 + number % 12), "16:30",
+                     "NORTHERN", "ARREST, BOOKED",
+                     "{0} Block of\r\nVAN NESS AV".format(number),
+                     x, "37.{0:04d}".format(number)])
+    return rows
+
+
+def write_csv(path, rows, line_end="\n", final_newline=True):
+    """Writes a CSV file with the header FIELDS and the given rows"""
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator=line_end)
+    writer.writerow(FIELDS)
+    writer.writerows(rows)
+    text = out.getvalue()
+    if not final_newline:
+        text = text[:-len(line_end)]
+    with open(path, "wb") as f:
+        f.write(text.encode("utf-8"))
+
+
+def rows_of_features(rows, report):
+    """iter_features for parallel_features: one "feature" per row"""
+    for row in rows:
+        report["accepted"] += 1
+        yield {"id": 0, "number": row["IncidntNum"]}
+
+
+class TestChunkRanges(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "incidents.csv")
+        self.rows = make_rows(200)
+        # Tiny blocks make boundaries fall within quoted fields and
+        # between the "\r" and "\n" of line ends.
+        self.block_size = parallel.BLOCK_SIZE
+        parallel.BLOCK_SIZE = 7
+
+    def tearDown(self):
+        parallel.BLOCK_SIZE = self.block_size
+        shutil.rmtree(self.directory)
+
+    def check_chunks(self, **kwargs):
+        write_csv(self.path, self.rows, **kwargs)
+        for chunks in (1, 2, 3, 7, 50, 400):
+            header, ranges = parallel.chunk_ranges(self.path, chunks)
+            self.assertEqual(next(csv.reader([header])), FIELDS)
+            self.assertLessEqual(len(ranges), chunks)
+            self.assertEqual(ranges[-1][1], os.path.getsize(self.path))
+            for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, start)
+            with open(self.path) as f:
+                expected = list(csv.reader(f))[1:]
+            rows = []
+            for start, end in ranges:
+                rows.extend([row[name] for name in FIELDS]
+                            for row in parallel.iter_chunk(
+                                self.path, ",", FIELDS, start, end))
+            # The same rows, with the same values, as parsing the whole
+            # file in text mode gives.
+            self.assertEqual(rows, expected)
+            self.assertEqual(len(rows), len(self.rows))
+
+    def test_quoted_commas_and_newlines(self):
+        self.check_chunks()
+
+    def test_crlf_line_ends(self):
+        self.check_chunks(line_end="\r\n")
+
+    def test_missing_final_newline(self):
+        self.check_chunks(final_newline=False)
+        self.check_chunks(line_end="\r\n", final_newline=False)
+
+    def test_next_boundary_skips_quoted_newlines(self):
+        write_csv(self.path, self.rows)
+        with open(self.path, "rb") as f:
+            data = f.read()
+            inside = data.index(b"HELLO")
+            # Starting within the quotes, the newline after HELLO doesn't
+            # count; the one ending the record does.
+            boundary = parallel._next_boundary(f, inside, 1)
+        self.assertEqual(data[boundary - 1:boundary], b"\n")
+        self.assertEqual(data[boundary:boundary + 9], b"000000003")
+        with open(self.path, "rb") as f:
+            self.assertIsNone(parallel._next_boundary(f, len(data), 0))
+
+    def test_parallel_count(self):
+        write_csv(self.path, self.rows, line_end="\r\n", final_newline=False)
+        self.assertEqual(
+            parallel.parallel_count(self.path, ",", "Category", 3),
+            Counter(row[1] for row in self.rows))
+
+    def test_parallel_features_keep_file_order(self):
+        write_csv(self.path, self.rows)
+        report = Counter()
+        features = list(parallel.parallel_features(
+            self.path, ",", rows_of_features, 3, report))
+        self.assertEqual([feature["number"] for feature in features],
+                         [row[0] for row in self.rows])
+        self.assertEqual(report["accepted"], len(self.rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Data Visualization Project - Filtering incidents
+
+Parses filter expressions such as
+
+    PdDistrict=NORTHERN
+    Category in (FRAUD,ASSAULT)
+    Date>=2003-01-01
+
+and turns a list of them (all of which have to match) into a single
+Python function over raw CSV rows.  The function is compiled once, so
+checking a row costs no more than a hand-written `if`, and rows that
+don't match are dropped before any dict or array is built for them.
+
+The same conditions can also be applied to a whole IncidentTable at
+once, by testing every distinct label of a column only once.
+"""
+import operator
+import re
+
+import numpy as np
+
+from incidents import COORDINATE_COLUMNS
+
+
+_EXPRESSION = re.compile(
+    r"^\s*(?P<column>\w+)\s*(?:"
+    r"(?P<membership>not\s+in|in)\s*\((?P<values>.*)\)"
+    r"|(?P<operator>!=|>=|<=|=|<|>)\s*(?P<value>.*?)"
+    r")\s*$", re.IGNORECASE)
+
+_COMPARISONS = {"=": "==", "!=": "!=", ">=": ">=", "<=": "<=", "<": "<",
+                ">": ">"}
+
+_OPERATORS = {"==": operator.eq, "!=": operator.ne, ">=": operator.ge,
+              "<=": operator.le, "<": operator.lt, ">": operator.gt}
+
+
+def _number(value):
+    """Converts a coordinate to float, mapping malformed ones to NaN"""
+    try:
+        return float(value)
+    except ValueError:
+        return float("nan")
+
+
+def _sortable_date(value):
+    """Turns "MM/DD/YYYY" or "YYYY-MM-DD" into "YYYYMMDD", which sorts
+    like the date itself."""
+    if "/" in value:
+        return value[6:10] + value[0:2] + value[3:5]
+    return value.replace("-", "")
+
+
+class Condition(object):
+    """One filter expression: a column, an operator and its value(s).
+
+    `operator` is a Python comparison ("==", "<", ...) or "in" / "not in".
+    Dates are compared as dates and coordinates as numbers; everything
+    else is compared as text.
+    """
+
+    def __init__(self, column, operator, values):
+        self.column = column
+        self.operator = operator
+        if column == "Date":
+            self.normalize = _sortable_date
+            self.source = "({0}[6:10] + {0}[0:2] + {0}[3:5])"
+        elif column in COORDINATE_COLUMNS:
+            self.normalize = _number
+            self.source = "_number({0})"
+        else:
+            self.normalize = str
+            self.source = "{0}"
+        values = [self.normalize(value) for value in values]
+        if operator in ("in", "not in"):
+            self.value = frozenset(values)
+        else:
+            self.value = values[0]
+
+    def matches(self, value):
+        """Tells whether one already normalized value matches"""
+        if self.operator == "in":
+            return value in self.value
+        if self.operator == "not in":
+            return value not in self.value
+        return _OPERATORS[self.operator](value, self.value)
+
+    def key(self):
+        """Returns the condition as a JSON-serializable list that is the
+        same in every process, e.g. for telling whether two runs used the
+        same filters.  (The order of a frozenset, and with it its repr,
+        changes from one process to the next.)"""
+        if self.operator in ("in", "not in"):
+            values = sorted(self.value)
+        else:
+            values = [self.value]
+        return [self.column, self.operator, [repr(value) for value in values]]
+
+    def __repr__(self):
+        return "Condition({0!r}, {1!r}, {2!r})".format(
+            self.column, self.operator, self.value)
+
+
+def parse_where(expression):
+    """Parses one filter expression into a Condition.  Raises ValueError
+    if the expression can't be understood."""
+    match = _EXPRESSION.match(expression)
+    if match is None:
+        raise ValueError("Can't understand filter {0!r}".format(expression))
+    if match.group("membership"):
+        operator = " ".join(match.group("membership").lower().split())
+        values = [value.strip() for value in match.group("values").split(",")]
+    else:
+        operator = _COMPARISONS[match.group("operator")]
+        values = [match.group("value")]
+    return Condition(match.group("column"), operator, values)
+
+
+def compile_conditions(conditions, fields):
+    """Compiles conditions into one function telling whether a raw CSV
+    row (a list of strings in the order of fields) matches all of them.
+
+    Returns None when there are no conditions, so callers can skip
+    filtering altogether.
+    """
+    if not conditions:
+        return None
+
+    namespace = {"_number": _number}
+    tests = []
+    for number, condition in enumerate(conditions):
+        if condition.column not in fields:
+            raise ValueError("Unknown column {0!r}".format(condition.column))
+        cell = "row[{0}]".format(fields.index(condition.column))
+        name = "_value{0}".format(number)
+        namespace[name] = condition.value
+        tests.append("{0} {1} {2}".format(condition.source.format(cell),
+                                          condition.operator, name))
+    return eval("lambda row: " + " and ".join(tests), namespace)
+
+
+def table_mask(conditions, table):
+    """Returns a boolean mask of the rows of an IncidentTable matching all
+    conditions."""
+    mask = np.ones(len(table), dtype=bool)
+    for condition in conditions:
+        column = table.columns[condition.column]
+        labels = table.labels.get(condition.column)
+        if labels is None:
+            # Coordinates are compared as whole arrays.
+            if condition.operator in ("in", "not in"):
+                matches = np.isin(column, list(condition.value))
+                if condition.operator == "not in":
+                    matches = ~matches
+            else:
+                matches = _OPERATORS[condition.operator](column,
+                                                         condition.value)
+        else:
+            # Test every label once, then look up the result per row.
+            matches = np.array([condition.matches(condition.normalize(label))
+                                for label in labels], dtype=bool)
+            matches = matches[column]
+        mask &= matches
+    return mask
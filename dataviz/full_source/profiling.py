@@ -0,0 +1,190 @@
+"""
+Data Visualization Project - Profiling the stages of a run
+
+With --profile, dataviz.py records for every stage of a run (parsing,
+counting, writing the map, rendering the graphs, ...):
+
+  * the wall time and the CPU time spent in it, in seconds,
+  * the peak resident set size (RSS) while it ran, in MiB,
+  * the number of rows it handled, and the rows per second,
+
+and writes all of them as one JSON report, e.g. for a nightly job to
+compare against the reports of earlier runs.
+
+Stages can be nested: visualize_days, say, contains the render stage
+drawing its graph.  Without --profile, stages cost next to nothing.
+"""
+from contextlib import contextmanager
+from functools import wraps
+
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+from incidents import IncidentTable
+
+
+# Linux lets a process reset its peak RSS by writing "5" into this file,
+# which gives every stage its own peak.  Elsewhere, a stage reports the
+# peak of the whole process up to its end.
+CLEAR_REFS = "/proc/self/clear_refs"
+STATUS = "/proc/self/status"
+
+
+def _cpu_time():
+    """CPU time used so far by this process and its finished children"""
+    return sum(os.times()[:4])
+
+
+def _reset_peak():
+    """Resets the peak RSS of this process, where supported"""
+    try:
+        with open(CLEAR_REFS, "w") as f:
+            f.write("5")
+    except (IOError, OSError):
+        pass
+
+
+def peak_rss():
+    """Peak RSS of this process in MiB, since the last _reset_peak() if
+    there was one"""
+    try:
+        with open(STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    if sys.platform == "darwin":
+        return peak / 1024.0 / 1024.0
+    return peak / 1024.0
+
+
+class Stage(object):
+    """Measurements of one stage.  Code running inside a stage can set
+    `rows` to the number of rows it handled."""
+
+    def __init__(self, name, rows=None, depth=0):
+        self.name = name
+        self.rows = rows
+        self.depth = depth
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0.0
+
+    def to_dict(self):
+        stage = {"name": self.name,
+                 "depth": self.depth,
+                 "wall_seconds": round(self.wall, 6),
+                 "cpu_seconds": round(self.cpu, 6),
+                 "peak_rss_mib": round(self.peak, 1),
+                 "rows": self.rows,
+                 "rows_per_second": None}
+        if self.rows is not None and self.wall > 0:
+            stage["rows_per_second"] = round(self.rows / self.wall, 1)
+        return stage
+
+
+class Profiler(object):
+    """Collects the Stages of one run, in the order they started"""
+
+    def __init__(self):
+        self.stages = []
+        self.running = []
+        self.started = time.time()
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Measures the code within the with block as a stage"""
+        stage = Stage(name, rows, len(self.running))
+        self.stages.append(stage)
+        if self.running:
+            # The peak of the enclosing stage so far would be lost by
+            # the reset below.
+            parent = self.running[-1]
+            parent.peak = max(parent.peak, peak_rss())
+        self.running.append(stage)
+        _reset_peak()
+        wall = time.time()
+        cpu = _cpu_time()
+        try:
+            yield stage
+        finally:
+            stage.wall = time.time() - wall
+            stage.cpu = _cpu_time() - cpu
+            stage.peak = max(stage.peak, peak_rss())
+            self.running.pop()
+            if self.running:
+                parent = self.running[-1]
+                parent.peak = max(parent.peak, stage.peak)
+
+    def report(self):
+        """Returns the report as a JSON-like dict"""
+        return {"argv": sys.argv,
+                "python": platform.python_version(),
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S",
+                                         time.localtime(self.started)),
+                "wall_seconds": round(time.time() - self.started, 6),
+                "stages": [stage.to_dict() for stage in self.stages]}
+
+    def save(self, out_file):
+        """Writes the report into out_file as JSON"""
+        with open(out_file, "w") as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+# The profiler of the current run, if profiling is enabled.
+_profiler = None
+
+
+def enable():
+    """Starts profiling the current process and returns the Profiler"""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+@contextmanager
+def stage(name, rows=None):
+    """Measures the code within the with block as a stage, if profiling
+    is enabled.  Yields the Stage, or None when not profiling."""
+    if _profiler is None:
+        yield None
+        return
+    with _profiler.stage(name, rows) as current:
+        yield current
+
+
+def _rows(data):
+    """Number of rows in an IncidentTable or a list of rows, else None"""
+    if isinstance(data, (IncidentTable, list)):
+        return len(data)
+    return None
+
+
+def profiled(name):
+    """Decorator measuring every call of a function as a stage.
+
+    The rows handled are those of the first argument if it is an
+    IncidentTable or a list of rows, or else those of the returned
+    value.
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _profiler.stage(name, _rows(args[0]) if args else None) \
+                    as current:
+                result = func(*args, **kwargs)
+                if current.rows is None:
+                    current.rows = _rows(result)
+                return result
+        return wrapper
+    return decorate
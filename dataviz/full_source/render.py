@@ -0,0 +1,121 @@
+"""
+Data Visualization Project - Rendering charts
+
+Draws the graphs without pyplot's global state machine: every
+ChartRenderer owns one matplotlib Figure on the headless Agg canvas and
+reuses it for chart after chart, clearing it in between instead of
+setting up a new figure each time.
+
+render_batch() spreads many charts over a pool of processes, each with
+its own ChartRenderer.
+"""
+import multiprocessing
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
+
+
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
+        "Saturday", "Sunday")
+DAY_LABELS = ("Mon", "Tues", "Wed", "Thurs", "Fri", "Sat", "Sun")
+
+# Figure sizes in inches
+DAYS_SIZE = (8, 6)
+TYPE_SIZE = (12, 8)
+TIME_SIZE = (12, 6)
+
+
+class ChartRenderer(object):
+    """Renders charts into PNG files, reusing one figure for all of them"""
+
+    def __init__(self, dpi=80):
+        self.figure = Figure(dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+
+    def _axes(self, size, title=None):
+        """Clears the figure and returns fresh axes to draw on"""
+        self.figure.clear()
+        self.figure.set_size_inches(size)
+        axes = self.figure.add_subplot(1, 1, 1)
+        if title:
+            axes.set_title(title)
+        return axes
+
+    def days(self, counter, out_file, title=None):
+        """Plots incident counts per day of week"""
+        axes = self._axes(DAYS_SIZE, title)
+
+        # Order the counts by day of week when plotting.
+        axes.plot([counter[day] for day in DAYS])
+        axes.set_xticks(range(len(DAY_LABELS)))
+        axes.set_xticklabels(DAY_LABELS)
+        self.figure.savefig(out_file)
+
+    def types(self, counter, out_file, title=None):
+        """Plots incident counts per category as bar graph"""
+        axes = self._axes(TYPE_SIZE, title)
+
+        labels = tuple(counter.keys())
+        xlocations = np.arange(len(labels)) + 0.5
+        width = 0.5
+        axes.bar(xlocations, list(counter.values()), width=width)
+        axes.set_xticks(xlocations + width / 2)
+        axes.set_xticklabels(labels, rotation=90)
+
+        # Let matplotlib pick a handful of whole-number ticks; a tick
+        # every 5 incidents means thousands of ticks on large files.
+        axes.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+        # Give some more room so the labels aren't cut off in the graph
+        self.figure.subplots_adjust(bottom=0.4)
+        self.figure.savefig(out_file)
+
+    def time(self, buckets, counts, frequency, out_file, title=None):
+        """Plots incident counts per time bucket"""
+        axes = self._axes(TIME_SIZE, title)
+
+        # matplotlib understands NumPy dates.
+        axes.plot(buckets, counts)
+        axes.set_xlabel(frequency.capitalize())
+        axes.set_ylabel("Incidents")
+        self.figure.autofmt_xdate()
+        self.figure.savefig(out_file)
+
+
+# The renderer of the current process, created on first use.
+_renderer = None
+
+
+def default_renderer():
+    """Returns the ChartRenderer shared by everything in this process"""
+    global _renderer
+    if _renderer is None:
+        _renderer = ChartRenderer()
+    return _renderer
+
+
+def _render_job(job):
+    """Worker: renders one chart with the renderer of its process"""
+    chart, args = job
+    getattr(default_renderer(), chart)(*args)
+
+
+def render_batch(jobs, workers=1):
+    """Renders many charts, in a pool of processes if workers > 1.
+
+    Every job is a (chart, args) tuple, where chart names a method of
+    ChartRenderer and args are its arguments, e.g.
+    ("days", (counter, "Days_NORTHERN.png", "NORTHERN")).
+    """
+    if workers <= 1:
+        for job in jobs:
+            _render_job(job)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        pool.map(_render_job, jobs)
+    finally:
+        pool.close()
+        pool.join()
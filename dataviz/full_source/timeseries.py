@@ -0,0 +1,134 @@
+"""
+Data Visualization Project - Incidents over time
+
+Turns the Date ("02/18/2003") and Time ("16:30") columns of an
+IncidentTable into one int64 array of seconds since the epoch, and keeps
+the rows sorted by that time so that date ranges are found by binary
+search.
+
+Both columns are dictionary-encoded, so each distinct date and time is
+parsed only once, no matter how many incidents share it; the result is
+then spread over all rows by indexing with the codes.
+"""
+import numpy as np
+
+
+# Bucket sizes for TimeIndex.counts(), as NumPy datetime units.  Weeks
+# are handled separately, since NumPy's weeks start on a Thursday.
+FREQUENCIES = {"hour": "h", "day": "D", "week": "D", "month": "M"}
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# int64 value NumPy uses for "not a time".
+NAT = np.datetime64("NaT").astype(np.int64)
+
+
+def parse_dates(labels):
+    """Converts "MM/DD/YYYY" strings into days since 1970-01-01.
+    Malformed dates end up as NAT."""
+    iso = [label[6:10] + "-" + label[0:2] + "-" + label[3:5]
+           for label in labels]
+    try:
+        days = np.array(iso, dtype="datetime64[D]")
+    except ValueError:
+        days = np.empty(len(iso), dtype="datetime64[D]")
+        for index, value in enumerate(iso):
+            try:
+                days[index] = np.datetime64(value, "D")
+            except ValueError:
+                days[index] = np.datetime64("NaT")
+    return days.astype(np.int64)
+
+
+def parse_times(labels):
+    """Converts "HH:MM" strings into minutes since midnight.  Malformed
+    times count as midnight."""
+    minutes = np.zeros(len(labels), dtype=np.int64)
+    for index, label in enumerate(labels):
+        try:
+            minutes[index] = int(label[0:2]) * 60 + int(label[3:5])
+        except ValueError:
+            pass
+    return minutes
+
+
+def epoch_seconds(table):
+    """Returns the time of every incident in an IncidentTable as seconds
+    since the epoch, or NAT where the date can't be parsed."""
+    days = parse_dates(table.labels["Date"])[table.columns["Date"]]
+    minutes = parse_times(table.labels["Time"])[table.columns["Time"]]
+    seconds = days * SECONDS_PER_DAY + minutes * 60
+    seconds[days == NAT] = NAT
+    return seconds
+
+
+def years(table):
+    """Returns the distinct years of the incidents in an IncidentTable as
+    strings, and for every row the index of its year in that list."""
+    days = parse_dates(table.labels["Date"])
+    label_years = days.astype("datetime64[D]").astype("datetime64[Y]")
+    label_years = label_years.astype(np.int64) + 1970
+    label_years[days == NAT] = -1
+    values, groups = np.unique(label_years[table.columns["Date"]],
+                               return_inverse=True)
+    labels = [str(year) if year >= 0 else "" for year in values.tolist()]
+    return labels, groups.ravel()
+
+
+def to_seconds(date):
+    """Converts a "YYYY-MM-DD" string into seconds since the epoch"""
+    return int(np.datetime64(date, "s").astype(np.int64))
+
+
+class TimeIndex(object):
+    """The incidents of a table, sorted by time.
+
+    `order` holds the row numbers sorted by time, `times` the matching
+    times in seconds since the epoch.  Rows without a valid date are left
+    out.
+    """
+
+    def __init__(self, seconds):
+        valid = np.flatnonzero(seconds != NAT)
+        self.order = valid[np.argsort(seconds[valid], kind="mergesort")]
+        self.times = seconds[self.order]
+
+    @classmethod
+    def from_table(cls, table):
+        return cls(epoch_seconds(table))
+
+    def _slice(self, start=None, end=None):
+        """Returns the positions in `times` of the range [start, end)"""
+        low = 0 if start is None else np.searchsorted(self.times, start)
+        high = (len(self.times) if end is None
+                else np.searchsorted(self.times, end))
+        return low, high
+
+    def between(self, start=None, end=None):
+        """Returns the row numbers of the incidents that happened from
+        start (inclusive) to end (exclusive), both in seconds since the
+        epoch."""
+        low, high = self._slice(start, end)
+        return self.order[low:high]
+
+    def counts(self, frequency, start=None, end=None):
+        """Counts the incidents per hour, day, week or month.
+
+        Returns the start of every bucket as datetime64 array and the
+        number of incidents in it.  Weeks start on Mondays.
+        """
+        low, high = self._slice(start, end)
+        times = self.times[low:high].astype("datetime64[s]")
+        buckets = times.astype("datetime64[{0}]".format(
+            FREQUENCIES[frequency]))
+        if frequency == "week":
+            # 1970-01-01 was a Thursday, so shift every day back to the
+            # Monday of its week.
+            days = buckets.astype(np.int64)
+            buckets = (days - (days + 3) % 7).astype("datetime64[D]")
+        # The times are sorted, so each bucket is one contiguous run and
+        # we only need to find where the runs start.
+        starts = np.flatnonzero(buckets[1:] != buckets[:-1]) + 1
+        starts = np.concatenate([[0], starts]) if len(buckets) else starts
+        counts = np.diff(np.append(starts, len(buckets)))
+        return buckets[starts], counts
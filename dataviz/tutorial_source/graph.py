@@ -18,6 +18,24 @@ import numpy as np
 MY_FILE = "../data/sample_sfpd_incident_all.csv"
 
 
+def iter_parse(raw_file, delimiter):
+    """Parses a raw CSV file lazily, yielding one JSON-like dict per row"""
+
+    # Open CSV file, and safely close it when we're done
+    with open(raw_file) as opened_file:
+
+        # Read the CSV data
+        csv_data = csv.reader(opened_file, delimiter=delimiter)
+
+        # Skip over the first line of the file for the headers
+        fields = next(csv_data)
+
+        # Hand out each row as soon as it is read instead of keeping
+        # the whole file in a list
+        for row in csv_data:
+            yield dict(zip(fields, row))
+
+
 def parse(raw_file, delimiter):
     """Parses a raw CSV file to a JSON-like object"""
 
@@ -45,7 +63,7 @@ def parse(raw_file, delimiter):
 
 def visualize_days():
     """Visualize data by day of week"""
-    data_file = parse(MY_FILE, ",")
+    data_file = iter_parse(MY_FILE, ",")
     # Returns a dict where it sums the total values for each key.
     # In this case, the keys are the DaysOfWeek, and the values are
     # a count of incidents.
@@ -80,7 +98,7 @@ def visualize_days():
 
 def visualize_type():
     """Visualize data by category in a bar graph"""
-    data_file = parse(MY_FILE, ",")
+    data_file = iter_parse(MY_FILE, ",")
     # Same as before, this returns a dict where it sums the total
     # incidents per Category.
     counter = Counter(item["Category"] for item in data_file)
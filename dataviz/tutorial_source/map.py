@@ -70,7 +70,7 @@ def create_map(data_file):
 
 
 def main():
-    data = p.parse(p.MY_FILE, ",")
+    data = p.iter_parse(p.MY_FILE, ",")
 
     return create_map(data)
 
@@ -18,6 +18,24 @@ import csv
 MY_FILE = "../data/sample_sfpd_incident_all.csv"
 
 
+def iter_parse(raw_file, delimiter):
+    """Parses a raw CSV file lazily, yielding one JSON-like dict per row"""
+
+    # Open CSV file, and safely close it when we're done
+    with open(raw_file) as opened_file:
+
+        # Read the CSV data
+        csv_data = csv.reader(opened_file, delimiter=delimiter)
+
+        # Skip over the first line of the file for the headers
+        fields = next(csv_data)
+
+        # Hand out each row as soon as it is read instead of keeping
+        # the whole file in a list
+        for row in csv_data:
+            yield dict(zip(fields, row))
+
+
 def parse(raw_file, delimiter):
     """Parses a raw CSV file to a JSON-like object"""
 